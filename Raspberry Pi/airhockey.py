@@ -5,7 +5,7 @@
 ##  - Frame calibration
 ##  - HSV calibration 
 ##  - Main detection loop 
-##  - Exponential smoothing on puck to reduce jitter
+##  - Kalman filtering of puck position and velocity
 ##  - Serial communication with air hockey table controller
 ##  - Multiple prediction modes including aggressive behavior
 ## @author Kyle Schumacher
@@ -16,12 +16,20 @@
 ##   python3 airhockey.py --mode calibrate_frame
 ##   python3 airhockey.py --mode calibrate_hsv
 ##   python3 airhockey.py --mode run
+##   python3 airhockey.py --mode run --headless   # no window, no drawing
+##   python3 airhockey.py --mode run --opencl     # OpenCL image processing
+##   python3 airhockey.py --mode run --mask red   # red objects, no HSV pass
+##   python3 airhockey.py --mode run --decimate 2 # detect on every 2nd frame
 ##
 ## Dependencies:
 ##   sudo apt update
 ##   sudo apt install python3-pip
 ##   pip3 install opencv-python numpy pyserial
 ##
+## Optional (used automatically when installed):
+##   sudo apt install python3-picamera2   # zero-copy libcamera capture
+##   pip3 install numba                   # JIT-compiled prediction math
+##
 ## To autostart on boot, create a systemd service pointing to:
 ##   ExecStart=/usr/bin/python3 /home/pi/airhockey.py --mode run
 
@@ -33,6 +41,24 @@ import os
 import math
 import serial
 import time
+import threading
+import signal
+import queue
+import functools
+
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None
+
+try:
+    from numba import njit
+except ImportError:
+    ## @brief Stand-in for numba.njit when numba is not installed (runs plain Python)
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
 
 # ------------------------------------------------------------------------------
 ## @name Configuration Constants
@@ -48,17 +74,52 @@ HSV_CALIB_FILE   = "hsv_ranges.json"
 SERIAL_PORT = "/dev/serial0"
 ## @brief Baud rate for serial communication
 BAUD_RATE   = 115200
+## @brief Move command sent to the controller: MXXXXYYYY\r\n (ASCII, 4-digit coordinates)
+MOVE_CMD_FMT = b"M%04d%04d\r\n"
+## @brief Controller X coordinate at the right table edge (left edge is 0)
+CONTROLLER_X_RANGE = 2857
+## @brief Controller Y coordinate at the bottom table edge (top edge is 0)
+CONTROLLER_Y_RANGE = 4873
+## @brief Resend an unchanged command after this long (seconds) in case it was lost
+SERIAL_RESEND_INTERVAL = 0.25
 
 ## @brief Minimum radius for valid object detection (pixels)
 MIN_RADIUS = 15
-## @brief Minimum contour area threshold for object detection
-## Only consider contours with area at least ~half that of a circle radius MIN_RADIUS
+## @brief Minimum object area threshold for object detection
+## Only consider objects with area at least ~half that of a circle radius MIN_RADIUS
 AREA_THRESH = math.pi * (MIN_RADIUS ** 2) * 0.5
 
-## @brief Exponential smoothing factor for puck position filtering (0-1)
-SMOOTHING_ALPHA = 0.3
+## @brief Downsampling factor of the warped table image used for detection
+## The puck (radius >= MIN_RADIUS) stays well above noise size at half resolution
+DETECT_SCALE = 2
+## @brief Object area threshold in the downsampled detection image
+DETECT_AREA_THRESH = AREA_THRESH / (DETECT_SCALE ** 2)
+
+## @brief Minimum R - max(G, B) for a pixel to count as red in red mask mode
+RED_THRESH = 60
+
+## @brief Search margin around tracked objects (table pixels); covers a fast puck's
+## per-frame motion
+TRACK_MARGIN = MIN_RADIUS * 4
+## @brief Force a full-table detection at least this often (frames) while tracking
+TRACK_REFRESH_FRAMES = 15
+## @brief Largest temporal decimation factor (detect on every Nth frame)
+## Beyond this the puck travels too far between detections to extrapolate
+MAX_DECIMATE = 4
+
+## @brief Kalman process noise of the puck position (table pixels^2 per frame)
+KALMAN_POS_NOISE = 0.1
+## @brief Kalman process noise of the puck velocity ((pixels/frame)^2 per frame)
+## Large enough to follow the sudden velocity change of a bounce or a hit
+KALMAN_VEL_NOISE = 1.0
+## @brief Kalman measurement noise of the detected puck centre (table pixels^2)
+KALMAN_MEAS_NOISE = 1.0
+## @brief Restart the puck filter once the puck has been missed by this many detections
+KALMAN_MAX_MISSED = 5
 ## @brief Velocity threshold for determining if puck is moving significantly
 VEL_THRESHOLD   = 2.0
+## @brief VEL_THRESHOLD squared, compared against the squared speed (no sqrt)
+VEL_THRESHOLD_SQ = VEL_THRESHOLD * VEL_THRESHOLD
 
 ## @brief Number of clicks required per side during frame calibration
 CLICKS_PER_SIDE = 2
@@ -72,6 +133,25 @@ V_MARGIN = 10
 
 ## @brief Target frame rate for detection loop
 FRAME_RATE = 30.0
+## @brief Weight of the newest frame in the FPS moving average (0-1)
+FPS_EMA_ALPHA = 0.1
+## @brief Refresh interval of the on-screen FPS label (seconds)
+FPS_LABEL_INTERVAL = 0.5
+## @brief Key code that quits the run loop
+QUIT_KEY = ord('q')
+
+## @brief Camera capture width in pixels (calibration files depend on this)
+CAMERA_WIDTH  = 640
+## @brief Camera capture height in pixels (calibration files depend on this)
+CAMERA_HEIGHT = 480
+## @brief Pixel format requested from V4L2 cameras (None keeps the driver default)
+## MJPG needs far less USB bandwidth than raw YUYV for the same frame size
+CAMERA_FOURCC = "MJPG"
+
+## @brief Worker threads for OpenCV's parallel loops
+## Two of the Pi's four cores; the rest are left to the capture, display and
+## serial threads so OpenCV's pool does not compete with them
+CV_NUM_THREADS = 2
 
 ## @}
 
@@ -85,10 +165,8 @@ clicks        = []
 ## @brief List of HSV color samples for color calibration
 hsv_samples   = []
 
-## @brief Current smoothed puck position (x, y)
+## @brief Current filtered puck position (x, y)
 smoothed_puck       = None
-## @brief Previous smoothed puck position for velocity calculation
-prev_smoothed_puck  = None
 
 ## @}
 
@@ -97,31 +175,25 @@ prev_smoothed_puck  = None
 ## @{
 # ------------------------------------------------------------------------------
 
-## @brief Calculate line equation from two points
-## @param pt1 First point (x, y)
-## @param pt2 Second point (x, y)
-## @return Tuple (a, b, c) representing line equation ax + by + c = 0
-def line_from_two_points(pt1, pt2):
-    x1, y1 = pt1
-    x2, y2 = pt2
-    a = float(y1 - y2)
-    b = float(x2 - x1)
-    c = float(x1 * y2 - x2 * y1)
-    return (a, b, c)
-
-## @brief Find intersection point of two lines
-## @param l1 First line (a, b, c)
-## @param l2 Second line (a, b, c)
-## @return Intersection point (x, y)
-def intersect_lines(l1, l2):
-    a1, b1, c1 = l1
-    a2, b2, c2 = l2
-    denom = (a1 * b2 - a2 * b1)
-    if abs(denom) < 1e-8:
-        return (0.0, 0.0)
-    x = (b1 * c2 - b2 * c1) / denom
-    y = (c1 * a2 - c2 * a1) / denom
-    return (x, y)
+## @brief Compute the four table corners from the frame calibration clicks
+## @details Each side is the line ax + by + c = 0 through its two clicked points.
+##          In homogeneous form the intersection of two lines is their cross
+##          product, so all four sides and corners are computed in one
+##          vectorized pass. Parallel sides yield the corner (0, 0).
+## @param clicks Eight (x, y) points: two each on TOP, RIGHT, BOTTOM, LEFT
+## @return 4x2 float64 array of corners in order (tl, tr, br, bl)
+def table_corners_from_clicks(clicks):
+    pts = np.asarray(clicks, dtype=np.float64).reshape(4, 2, 2)
+    a = pts[:, 0, 1] - pts[:, 1, 1]
+    b = pts[:, 1, 0] - pts[:, 0, 0]
+    c = pts[:, 0, 0] * pts[:, 1, 1] - pts[:, 1, 0] * pts[:, 0, 1]
+    lines = np.stack([a, b, c], axis=1)  # top, right, bottom, left
+
+    # tl = top x left, tr = top x right, br = bottom x right, bl = bottom x left
+    hom = np.cross(lines[[0, 0, 2, 2]], lines[[3, 1, 1, 3]])
+    w = hom[:, 2:]
+    parallel = np.abs(w) < 1e-8
+    return np.where(parallel, 0.0, hom[:, :2] / np.where(parallel, 1.0, w))
 
 ## @brief Save perspective transformation matrix to file
 ## @param filename Output filename
@@ -148,6 +220,77 @@ def load_warp_matrix(filename):
     h   = int(data["height"])
     return mat, w, h
 
+## @brief Precompute remap tables equivalent to a fixed perspective warp
+## @details cv2.warpPerspective re-evaluates the homography for every output
+##          pixel on each call. Since the warp matrix is fixed for the whole run,
+##          the per-pixel source coordinates are computed once here and each
+##          frame only needs a cv2.remap lookup.
+## @param matrix 3x3 transformation matrix
+## @param width Transformed image width
+## @param height Transformed image height
+## @param scale Integer downsampling factor folded into the warp (1 = full size)
+## @return Tuple (map1, map2) in fixed-point CV_16SC2 format for cv2.remap
+def build_warp_maps(matrix, width, height, scale=1):
+    identity = np.eye(3, dtype=np.float32)
+    if scale != 1:
+        matrix = np.diag([1.0 / scale, 1.0 / scale, 1.0]).astype(np.float32) @ matrix
+    return cv2.initUndistortRectifyMap(identity, None, matrix, identity,
+                                       (width // scale, height // scale), cv2.CV_16SC2)
+
+## @brief Find the camera frame region that the table warp reads from
+## @details Maps the corners of the warped table image back into the camera
+##          frame. Pixels outside their bounding box never reach the warp, so
+##          the camera only needs to deliver this region.
+## @param matrix 3x3 transformation matrix (camera frame -> table)
+## @param width Transformed image width
+## @param height Transformed image height
+## @return Tuple (x, y, w, h) in camera frame pixels, clipped to the frame
+def warp_source_roi(matrix, width, height):
+    table_corners = np.array([[[0, 0], [width - 1, 0],
+                               [width - 1, height - 1], [0, height - 1]]], dtype=np.float32)
+    src = cv2.perspectiveTransform(table_corners, np.linalg.inv(matrix))[0]
+    # One pixel of margin for bilinear interpolation at the edges
+    x0 = max(int(np.floor(src[:, 0].min())) - 1, 0)
+    y0 = max(int(np.floor(src[:, 1].min())) - 1, 0)
+    x1 = min(int(np.ceil(src[:, 0].max())) + 2, CAMERA_WIDTH)
+    y1 = min(int(np.ceil(src[:, 1].max())) + 2, CAMERA_HEIGHT)
+    return x0, y0, x1 - x0, y1 - y0
+
+## @brief Search windows around tracked objects
+## @details Each object's bounding box is grown by the margin and clipped to
+##          the image. Overlapping boxes are merged into one window so an
+##          object is never searched for twice.
+## @param boxes Bounding boxes (x, y, w, h) of the tracked objects
+## @param margin Margin around each bounding box (pixels)
+## @param width Image width
+## @param height Image height
+## @return List of (y0, y1, x0, x1) windows
+def tracking_windows(boxes, margin, width, height):
+    windows = []
+    for x, y, w, h in boxes:
+        windows.append((max(y - margin, 0), min(y + h + margin, height),
+                        max(x - margin, 0), min(x + w + margin, width)))
+    if len(windows) == 2:
+        (ay0, ay1, ax0, ax1), (by0, by1, bx0, bx1) = windows
+        if ay0 < by1 and by0 < ay1 and ax0 < bx1 and bx0 < ax1:
+            windows = [(min(ay0, by0), max(ay1, by1), min(ax0, bx0), max(ax1, bx1))]
+    return windows
+
+## @brief Check whether an object found in a search window may be cut off by it
+## @details A window edge that is not also the image border can clip an object
+##          that moved further than the margin, which shrinks its area and
+##          pulls its centroid back towards the window.
+## @param box Bounding box (x, y, w, h) of the object in image coordinates
+## @param window (y0, y1, x0, x1) window the object was found in
+## @param width Image width
+## @param height Image height
+## @return True if the box touches an edge of the window inside the image
+def touches_window_edge(box, window, width, height):
+    x, y, w, h = box
+    y0, y1, x0, x1 = window
+    return ((x0 > 0 and x <= x0) or (x1 < width and x + w >= x1) or
+            (y0 > 0 and y <= y0) or (y1 < height and y + h >= y1))
+
 ## @brief Save HSV color ranges to file
 ## @param filename Output filename
 ## @param hsv_dict Dictionary containing HSV min/max values
@@ -165,6 +308,30 @@ def load_hsv_ranges(filename):
     upper = np.array([data["h_max"], data["s_max"], data["v_max"]], dtype=np.uint8)
     return lower, upper
 
+## @brief Compute HSV threshold ranges from the sampled HSV bounds
+## @details Widens the per-channel sample min/max by the H/S/V margins and
+##          clips to OpenCV's HSV range.
+## @param sample_lo Per-channel minimum (h, s, v) of the samples
+## @param sample_hi Per-channel maximum (h, s, v) of the samples
+## @return Tuple (lower_bound, upper_bound) as numpy arrays
+def hsv_ranges_from_bounds(sample_lo, sample_hi):
+    margin = np.array([H_MARGIN, S_MARGIN, V_MARGIN])
+    lower = np.maximum(np.asarray(sample_lo) - margin, 0)
+    upper = np.minimum(np.asarray(sample_hi) + margin, [180, 255, 255])
+    return lower.astype(np.uint8), upper.astype(np.uint8)
+
+## @brief Threshold red objects directly on a BGR image
+## @details Marks pixels where R - max(G, B) exceeds the threshold, skipping the
+##          BGR -> HSV conversion. Works on both numpy arrays and cv2.UMat.
+## @param img BGR image
+## @param thresh Minimum R - max(G, B) difference
+## @param dst Optional preallocated single-channel output
+## @return Binary mask (255 = red)
+def red_mask(img, thresh, dst=None):
+    b, g, r = cv2.split(img)
+    diff = cv2.subtract(r, cv2.max(b, g))  # Saturates at 0 for non-red pixels
+    return cv2.threshold(diff, thresh, 255, cv2.THRESH_BINARY, dst=dst)[1]
+
 ## @brief Mouse callback function for frame calibration
 ## @param event OpenCV mouse event type
 ## @param x Mouse x coordinate
@@ -178,6 +345,263 @@ def mouse_callback_frame(event, x, y, flags, param):
 
 ## @}
 
+# ------------------------------------------------------------------------------
+## @name Camera Functions
+## @{
+# ------------------------------------------------------------------------------
+
+## @brief cv2.VideoCapture-compatible wrapper around a picamera2 stream
+## @details picamera2 delivers frames from the libcamera pipeline directly as
+##          NumPy arrays, avoiding the V4L2 path and its extra frame copy.
+class PiCamera2Capture:
+    ## @brief Configure and start the camera
+    ## @param width Capture width in pixels
+    ## @param height Capture height in pixels
+    ## @param roi Optional (x, y, w, h) region of the width x height frame to
+    ##        crop to in the camera pipeline
+    def __init__(self, width, height, roi=None):
+        self.picam2 = Picamera2()
+        ## @brief 3x3 map from delivered frame pixels to width x height frame
+        ##        pixels, or None when the full frame is delivered
+        self.frame_to_calib = None
+        config = self._video_config((width, height))
+        self.picam2.configure(config)
+        self.picam2.start()
+        if roi is not None:
+            try:
+                self._crop_to(roi, width, height, config)
+            except Exception as e:
+                print(f"[WARN] Camera ROI crop failed ({e}), using full frame")
+                self.picam2.stop()
+                self.frame_to_calib = None
+                self.picam2.configure(config)
+                self.picam2.start()
+
+    ## @brief Build a BGR video configuration
+    ## @param size Output (width, height)
+    ## @param sensor Optional sensor mode to pin
+    ## @return picamera2 configuration
+    def _video_config(self, size, sensor=None):
+        # picamera2 "RGB888" is laid out B, G, R in memory, i.e. OpenCV's BGR order
+        # queue=False makes capture_array() wait for a frame started after the
+        # request instead of returning one already sitting in the buffer queue
+        kwargs = {"sensor": sensor} if sensor is not None else {}
+        return self.picam2.create_video_configuration(
+            main={"format": "RGB888", "size": size},
+            controls={"FrameRate": FRAME_RATE},
+            queue=False, **kwargs)
+
+    ## @brief Restrict the ISP output to a region of the full frame
+    ## @details The ISP crops on the sensor (ScalerCrop) and outputs the region
+    ##          at the same pixel scale, so fewer pixels are produced, copied
+    ##          and read each frame. The sensor mode is pinned so the field of
+    ##          view matches the full-frame configuration used for calibration.
+    ## @param roi (x, y, w, h) region of the full frame
+    ## @param width Full frame width
+    ## @param height Full frame height
+    ## @param config Full-frame configuration that is currently running
+    def _crop_to(self, roi, width, height, config):
+        x, y, w, h = roi
+        fx, fy, fw, fh = self.picam2.capture_metadata()["ScalerCrop"]
+        sx, sy = fw / width, fh / height  # Sensor pixels per frame pixel
+        sensor = {"output_size": config["sensor"]["output_size"],
+                  "bit_depth": config["sensor"]["bit_depth"]}
+
+        self.picam2.stop()
+        crop_config = self._video_config((w, h), sensor)
+        self.picam2.align_configuration(crop_config)
+        self.picam2.configure(crop_config)
+        self.picam2.set_controls({"ScalerCrop": (int(fx + x * sx), int(fy + y * sy),
+                                                 int(w * sx), int(h * sy))})
+        self.picam2.start()
+
+        # The ISP may adjust the crop and the aligned output size, so derive the
+        # mapping from what is actually delivered
+        cx, cy, cw, ch = self.picam2.capture_metadata()["ScalerCrop"]
+        ow, oh = crop_config["main"]["size"]
+        self.frame_to_calib = np.array([
+            [cw / ow / sx, 0.0, (cx - fx) / sx],
+            [0.0, ch / oh / sy, (cy - fy) / sy],
+            [0.0, 0.0, 1.0]])
+
+    ## @brief Report whether the camera is running
+    ## @return Always True once constructed
+    def isOpened(self):
+        return True
+
+    ## @brief Capture the next frame
+    ## @return Tuple (ret, frame) like cv2.VideoCapture.read()
+    def read(self):
+        return True, self.picam2.capture_array("main")
+
+    ## @brief Stop the camera and release it
+    def release(self):
+        self.picam2.stop()
+        self.picam2.close()
+
+## @brief Open the table camera
+## @details Prefers picamera2 when it is installed and falls back to
+##          cv2.VideoCapture(0) otherwise. Either way the camera runs at
+##          FRAME_RATE and read() returns the newest frame rather than a
+##          stale queued one.
+## @param roi Optional (x, y, w, h) frame region to crop to (picamera2 only).
+##        When cropped, the capture's frame_to_calib maps frame pixels back to
+##        full-frame pixels.
+## @return Capture object providing isOpened(), read() and release()
+def open_camera(roi=None):
+    if Picamera2 is not None:
+        try:
+            return PiCamera2Capture(CAMERA_WIDTH, CAMERA_HEIGHT, roi)
+        except Exception as e:
+            print(f"[WARN] picamera2 unavailable ({e}), using cv2.VideoCapture")
+    cap = cv2.VideoCapture(0)
+    if CAMERA_FOURCC is not None:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*CAMERA_FOURCC))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Keep only the latest V4L2 buffer
+    cap.set(cv2.CAP_PROP_FPS, FRAME_RATE)
+    if cap.isOpened():
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        if size != (CAMERA_WIDTH, CAMERA_HEIGHT):
+            print(f"[WARN] Camera delivers {size[0]}x{size[1]}, "
+                  f"calibration expects {CAMERA_WIDTH}x{CAMERA_HEIGHT}")
+    return cap
+
+## @brief Capture frames on a background thread
+## @details Wraps a capture object so the camera wait and decode overlap with
+##          processing of the previous frame. Only the newest frame is kept;
+##          read() returns each captured frame at most once and waits for the
+##          next one if the loop is ahead of the camera. If the camera fails,
+##          the grabber thread stops and read() raises the camera's error.
+class FrameGrabber:
+    ## @brief Start grabbing from an open capture
+    ## @param cap Capture object providing read() and release()
+    def __init__(self, cap):
+        self.cap = cap
+        ## @brief Frame -> calibration frame map of the wrapped capture (if any)
+        self.frame_to_calib = getattr(cap, "frame_to_calib", None)
+        self.cond = threading.Condition()
+        self.frame = None
+        self.frame_id = 0       # Incremented for every captured frame
+        self.last_read_id = 0   # frame_id last handed out by read()
+        self.error = None       # Exception that stopped the grabber thread
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    ## @brief Report whether the wrapped camera is open
+    ## @return True if frames can be captured
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    ## @brief Get the newest frame not returned before
+    ## @return Tuple (ret, frame) like cv2.VideoCapture.read(); ret is False if
+    ##         no new frame arrived within a second
+    ## @exception Exception The camera error that stopped the grabber thread
+    def read(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame_id != self.last_read_id or self.error is not None,
+                               timeout=1.0)
+            if self.error is not None:
+                raise self.error
+            if self.frame_id == self.last_read_id:
+                return False, None
+            self.last_read_id = self.frame_id
+            return True, self.frame
+
+    ## @brief Stop the grabber thread and release the camera
+    def release(self):
+        self.running = False
+        self.thread.join()
+        self.cap.release()
+
+    ## @brief Grabber thread body: keep replacing the frame with the newest one
+    def _run(self):
+        while self.running:
+            try:
+                ret, frame = self.cap.read()
+            except Exception as e:
+                # Hand the failure to the consumer so the run stops instead of
+                # waiting for frames forever
+                print(f"ERROR: Camera read failed: {e}")
+                with self.cond:
+                    self.error = e
+                    self.cond.notify()
+                return
+            if not ret:
+                continue
+            with self.cond:
+                self.frame = frame
+                self.frame_id += 1
+                self.cond.notify()
+
+## @}
+
+# ------------------------------------------------------------------------------
+## @name Serial Functions
+## @{
+# ------------------------------------------------------------------------------
+
+## @brief Background writer for table controller commands
+## @details The controller receives one byte at a time, so each command is
+##          paced at 1 ms per byte (~11 ms per command). A daemon thread does
+##          the pacing so the detection loop never blocks on the UART. Only a
+##          few commands are queued; when the queue is full the oldest one is
+##          dropped so the controller always gets the most recent target.
+##          A command identical to the previous one is only resent every
+##          SERIAL_RESEND_INTERVAL, so a resting target costs no UART traffic.
+class SerialWriter:
+    ## @brief Start the writer thread
+    ## @param ser Open serial.Serial port
+    ## @param maxsize Maximum number of queued commands
+    def __init__(self, ser, maxsize=4):
+        self.ser = ser
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.last_msg = None
+        self.last_send_time = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    ## @brief Queue a command without blocking
+    ## @param msg Encoded command bytes
+    def send(self, msg):
+        now = time.monotonic()
+        if msg == self.last_msg and (now - self.last_send_time) < SERIAL_RESEND_INTERVAL:
+            return
+        self.last_msg = msg
+        self.last_send_time = now
+        while True:
+            try:
+                self.queue.put_nowait(msg)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()  # Drop the stale command
+                except queue.Empty:
+                    pass
+
+    ## @brief Flush queued commands and stop the thread
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    ## @brief Writer thread body: send queued commands byte-by-byte
+    def _run(self):
+        while True:
+            msg = self.queue.get()
+            if msg is None:
+                break
+            try:
+                # Small delays help prevent buffer overruns on the controller
+                for byte in msg:
+                    self.ser.write(bytes([byte]))  # Send single byte
+                    time.sleep(0.001)  # 1ms delay between bytes
+            except Exception as e:
+                print(f"Error sending command: {e}")
+
+## @}
+
 # ------------------------------------------------------------------------------
 ## @name Calibration Functions
 ## @{
@@ -189,7 +613,7 @@ def mouse_callback_frame(event, x, y, flags, param):
 def calibrate_frame():
     global clicks
     clicks = []
-    cap = cv2.VideoCapture(0)
+    cap = open_camera()
     if not cap.isOpened():
         print("ERROR: Could not open camera. Ensure Pi camera is enabled.")
         return
@@ -215,18 +639,17 @@ def calibrate_frame():
         if not ret:
             continue
 
-        vis = frame.copy()
+        # read() hands back a fresh frame every call, so mark it up in place
         for (x, y) in clicks:
-            cv2.circle(vis, (x, y), 6, (0, 255, 0), -1)
+            cv2.circle(frame, (x, y), 6, (0, 255, 0), -1)
 
-        cv2.putText(vis,
-                    f"Click 2 points on the {side_names[side_idx]} edge",
-                    (30, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1.0,
-                    (0, 255, 255),
-                    2)
-        cv2.imshow(window_name, vis)
+        draw_label(frame,
+                   f"Click 2 points on the {side_names[side_idx]} edge",
+                   (30, 50),
+                   1.0,
+                   (0, 255, 255),
+                   2)
+        cv2.imshow(window_name, frame)
 
         key = cv2.waitKey(30) & 0xFF
         if key == ord('n'):
@@ -250,30 +673,13 @@ def calibrate_frame():
         print(f"ERROR: Got {len(clicks)} points, expected 8. Aborting.")
         return
 
-    top_pts    = clicks[0:2]
-    right_pts  = clicks[2:4]
-    bottom_pts = clicks[4:6]
-    left_pts   = clicks[6:8]
-
-    l_top    = line_from_two_points(top_pts[0],    top_pts[1])
-    l_right  = line_from_two_points(right_pts[0],  right_pts[1])
-    l_bottom = line_from_two_points(bottom_pts[0], bottom_pts[1])
-    l_left   = line_from_two_points(left_pts[0],   left_pts[1])
+    corners = table_corners_from_clicks(clicks)
+    tl, tr, br, bl = corners
 
-    tl = intersect_lines(l_top,    l_left)
-    tr = intersect_lines(l_top,    l_right)
-    br = intersect_lines(l_bottom, l_right)
-    bl = intersect_lines(l_bottom, l_left)
+    maxWidth  = int(max(np.hypot(*(br - bl)), np.hypot(*(tr - tl))))
+    maxHeight = int(max(np.hypot(*(tr - br)), np.hypot(*(tl - bl))))
 
-    widthA  = math.hypot(br[0]-bl[0], br[1]-bl[1])
-    widthB  = math.hypot(tr[0]-tl[0], tr[1]-tl[1])
-    maxWidth  = max(int(widthA), int(widthB))
-
-    heightA = math.hypot(tr[0]-br[0], tr[1]-br[1])
-    heightB = math.hypot(tl[0]-bl[0], tl[1]-bl[1])
-    maxHeight = max(int(heightA), int(heightB))
-
-    src_pts = np.array([tl, tr, br, bl], dtype=np.float32)
+    src_pts = corners.astype(np.float32)
     dst_pts = np.array([
         [0, 0],
         [maxWidth - 1, 0],
@@ -292,19 +698,25 @@ def calibrate_hsv():
     global hsv_samples
     hsv_samples = []
 
-    cap = cv2.VideoCapture(0)
+    cap = open_camera()
     if not cap.isOpened():
         print("ERROR: Could not open camera for HSV calibration.")
         return
 
-    win_raw = "HSV Calibration - Raw"
-    win_masked = "HSV Calibration - Masked"
-    cv2.namedWindow(win_raw, cv2.WINDOW_NORMAL)
-    cv2.namedWindow(win_masked, cv2.WINDOW_NORMAL)
-    cv2.resizeWindow(win_raw, 800, 600)
-    cv2.resizeWindow(win_masked, 800, 600)
+    # Raw and masked views side by side in one window: one imshow per frame
+    win = "HSV Calibration - Raw | Masked"
+    cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+    cv2.resizeWindow(win, 1600, 600)
 
     frame_hsv = None
+    # Running sample bounds and the derived threshold ranges/label; updated
+    # per click in O(1) so the frame loop only reuses them
+    sample_lo = sample_hi = None
+    lower = np.zeros(3, dtype=np.uint8)
+    upper = np.zeros(3, dtype=np.uint8)
+    range_text = "Samples=0  H=[0-0]  S=[0-0]  V=[0-0]"
+    # Side-by-side display buffer, allocated on the first frame and reused
+    composite = None
     ## @brief Mouse callback for HSV calibration
     ## @param event OpenCV mouse event type
     ## @param x Mouse x coordinate
@@ -312,16 +724,29 @@ def calibrate_hsv():
     ## @param flags Mouse event flags
     ## @param param User data parameter
     def on_mouse(event, x, y, flags, param):
-        nonlocal frame_hsv
+        nonlocal frame_hsv, sample_lo, sample_hi, lower, upper, range_text
         if event == cv2.EVENT_LBUTTONDOWN and frame_hsv is not None:
+            # A click on the masked half samples the same pixel of the raw frame
+            x %= frame_hsv.shape[1]
             h, s, v = frame_hsv[y, x]
-            hsv_samples.append((int(h), int(s), int(v)))
+            sample = (int(h), int(s), int(v))
+            hsv_samples.append(sample)
+            if sample_lo is None:
+                sample_lo, sample_hi = sample, sample
+            else:
+                sample_lo = tuple(map(min, sample_lo, sample))
+                sample_hi = tuple(map(max, sample_hi, sample))
+            lower, upper = hsv_ranges_from_bounds(sample_lo, sample_hi)
+            h_min, s_min, v_min = lower.tolist()
+            h_max, s_max, v_max = upper.tolist()
+            range_text = (f"Samples={len(hsv_samples)}  H=[{h_min}-{h_max}]  "
+                          f"S=[{s_min}-{s_max}]  V=[{v_min}-{v_max}]")
             print(f"[HSV SAMPLE] ({x},{y}) → H={h}, S={s}, V={v}")
 
-    cv2.setMouseCallback(win_raw, on_mouse)
+    cv2.setMouseCallback(win, on_mouse)
 
     print("\n== HSV CALIBRATION ==")
-    print("Click each red circle in the RAW window. MASKED shows the mask.")
+    print("Click each red circle in the RAW view (left). MASKED (right) shows the mask.")
     print("Press 'q' when done.\n")
 
     while True:
@@ -329,46 +754,34 @@ def calibrate_hsv():
         if not ret:
             continue
 
+        # Converted every frame: the click handler samples from it
         frame_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
 
+        if composite is None:
+            h, w = frame.shape[:2]
+            composite = np.zeros((h, 2 * w, 3), dtype=np.uint8)
+            raw_vis, masked_vis = composite[:, :w], composite[:, w:]
+        np.copyto(raw_vis, frame)
+
+        # Masked preview: only the pixels inside the current HSV range
         if hsv_samples:
-            hs = [h for (h,s,v) in hsv_samples]
-            ss = [s for (h,s,v) in hsv_samples]
-            vs = [v for (h,s,v) in hsv_samples]
-            h_min = max(0,   min(hs) - H_MARGIN)
-            h_max = min(180, max(hs) + H_MARGIN)
-            s_min = max(0,   min(ss) - S_MARGIN)
-            s_max = min(255, max(ss) + S_MARGIN)
-            v_min = max(0,   min(vs) - V_MARGIN)
-            v_max = min(255, max(vs) + V_MARGIN)
-        else:
-            h_min = h_max = 0
-            s_min = s_max = 0
-            v_min = v_max = 0
-
-        lower = np.array([h_min, s_min, v_min], dtype=np.uint8)
-        upper = np.array([h_max, s_max, v_max], dtype=np.uint8)
-
-        vis_raw = frame.copy()
-        cv2.putText(vis_raw,
-                    f"Samples={len(hsv_samples)}  H=[{h_min}-{h_max}]  S=[{s_min}-{s_max}]  V=[{v_min}-{v_max}]",
-                    (30, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1.0,
-                    (0, 255, 255),
-                    2)
-        cv2.imshow(win_raw, vis_raw)
-
-        mask = cv2.inRange(frame_hsv, lower, upper)
-        masked_vis = cv2.bitwise_and(frame, frame, mask=mask)
-        cv2.putText(masked_vis,
-                    "Masked Preview",
-                    (30, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1.0,
-                    (0, 0, 255),
-                    2)
-        cv2.imshow(win_masked, masked_vis)
+            mask = cv2.inRange(frame_hsv, lower, upper)
+            masked_vis.fill(0)
+            cv2.copyTo(frame, mask, masked_vis)
+        # Without samples there is no range yet, so the preview stays black
+        draw_label(masked_vis,
+                   "Masked Preview",
+                   (30, 50),
+                   1.0,
+                   (0, 0, 255),
+                   2)
+        draw_label(raw_vis,
+                   range_text,
+                   (30, 50),
+                   1.0,
+                   (0, 255, 255),
+                   2)
+        cv2.imshow(win, composite)
 
         key = cv2.waitKey(30) & 0xFF
         if key == ord('q'):
@@ -381,15 +794,8 @@ def calibrate_hsv():
         print("No HSV samples; aborting.")
         return
 
-    hs = [h for (h,s,v) in hsv_samples]
-    ss = [s for (h,s,v) in hsv_samples]
-    vs = [v for (h,s,v) in hsv_samples]
-    h_min = max(0,   min(hs) - H_MARGIN)
-    h_max = min(180, max(hs) + H_MARGIN)
-    s_min = max(0,   min(ss) - S_MARGIN)
-    s_max = min(255, max(ss) + S_MARGIN)
-    v_min = max(0,   min(vs) - V_MARGIN)
-    v_max = min(255, max(vs) + V_MARGIN)
+    h_min, s_min, v_min = lower.tolist()
+    h_max, s_max, v_max = upper.tolist()
 
     hsv_dict = {
         "h_min": int(h_min),
@@ -410,57 +816,287 @@ def calibrate_hsv():
 ## @{
 # ------------------------------------------------------------------------------
 
-## @brief Reflect a velocity vector off a wall
-## @param vx X component of velocity
-## @param vy Y component of velocity
-## @param hit_wall Wall that was hit ("left", "right", "top", "bottom")
-## @return Tuple (new_vx, new_vy) with reflected velocity components
-def reflect_vector(vx, vy, hit_wall):
-    if hit_wall in ("left", "right"):
-        return (-vx, vy)
-    elif hit_wall in ("top", "bottom"):
-        return (vx, -vy)
-    else:
-        return (vx, vy)
-
-## @brief Calculate the first wall bounce for a moving object
+## @brief Wall id returned by compute_first_bounce when no wall is hit
+WALL_NONE   = -1
+## @brief Wall id of the left table edge (x = 0)
+WALL_LEFT   = 0
+## @brief Wall id of the right table edge (x = W)
+WALL_RIGHT  = 1
+## @brief Wall id of the top table edge (y = 0)
+WALL_TOP    = 2
+## @brief Wall id of the bottom table edge (y = H)
+WALL_BOTTOM = 3
+
+## @brief Calculate the first wall bounce for a moving object and its reflection
+## @details JIT-compiled with numba when available. Walls are axis-aligned, so
+##          the reflection is a sign flip of the velocity component normal to
+##          the wall that is hit. No fastmath: the inf sentinel must compare exactly.
 ## @param x0 Initial X position
 ## @param y0 Initial Y position
 ## @param vx X velocity component
 ## @param vy Y velocity component
 ## @param W Table width
 ## @param H Table height
-## @return Tuple (time, x_hit, y_hit, wall) or None if no collision
+## @return Tuple (time, x_hit, y_hit, vx_reflected, vy_reflected, wall_id);
+##         time is inf and wall_id is WALL_NONE if there is no collision
+@njit(cache=True)
 def compute_first_bounce(x0, y0, vx, vy, W, H):
-    candidates = []
+    # The sign of each velocity component picks the only vertical and the only
+    # horizontal wall that can be hit, so there are at most two candidates
+    tx = math.inf
     if vx < 0:
-        t = (0 - x0) / vx
-        if t > 1e-6:
-            y_hit = y0 + t * vy
-            if 0 <= y_hit <= H:
-                candidates.append((t, 0.0, y_hit, "left"))
-    if vx > 0:
-        t = (W - x0) / vx
-        if t > 1e-6:
-            y_hit = y0 + t * vy
-            if 0 <= y_hit <= H:
-                candidates.append((t, float(W), y_hit, "right"))
+        tx = (0 - x0) / vx
+    elif vx > 0:
+        tx = (W - x0) / vx
+    ty = math.inf
     if vy < 0:
-        t = (0 - y0) / vy
-        if t > 1e-6:
-            x_hit = x0 + t * vx
-            if 0 <= x_hit <= W:
-                candidates.append((t, x_hit, 0.0, "top"))
-    if vy > 0:
-        t = (H - y0) / vy
-        if t > 1e-6:
-            x_hit = x0 + t * vx
-            if 0 <= x_hit <= W:
-                candidates.append((t, x_hit, float(H), "bottom"))
-
-    if not candidates:
-        return None
-    return min(candidates, key=lambda e: e[0])
+        ty = (0 - y0) / vy
+    elif vy > 0:
+        ty = (H - y0) / vy
+
+    # Discard a candidate that is behind the object or lands outside the table
+    if not (tx > 1e-6 and 0 <= y0 + tx * vy <= H):
+        tx = math.inf
+    if not (ty > 1e-6 and 0 <= x0 + ty * vx <= W):
+        ty = math.inf
+
+    if tx == math.inf and ty == math.inf:
+        return math.inf, 0.0, 0.0, vx, vy, WALL_NONE
+    if tx <= ty:
+        return (tx, 0.0 if vx < 0 else float(W), y0 + tx * vy, -vx, vy,
+                WALL_LEFT if vx < 0 else WALL_RIGHT)
+    return (ty, x0 + ty * vx, 0.0 if vy < 0 else float(H), vx, -vy,
+            WALL_TOP if vy < 0 else WALL_BOTTOM)
+
+## @brief Create a constant-velocity Kalman filter for the puck
+## @details The state is (x, y, vx, vy) in table pixels and pixels per frame,
+##          so one predict() advances it by one frame. The measurement is the
+##          detected (x, y) centre.
+## @return cv2.KalmanFilter; start it with reset_puck_filter()
+def make_puck_filter():
+    kf = cv2.KalmanFilter(4, 2)
+    kf.transitionMatrix = np.array([[1, 0, 1, 0],
+                                    [0, 1, 0, 1],
+                                    [0, 0, 1, 0],
+                                    [0, 0, 0, 1]], dtype=np.float32)
+    kf.measurementMatrix = np.eye(2, 4, dtype=np.float32)
+    kf.processNoiseCov = np.diag([KALMAN_POS_NOISE, KALMAN_POS_NOISE,
+                                  KALMAN_VEL_NOISE, KALMAN_VEL_NOISE]).astype(np.float32)
+    kf.measurementNoiseCov = np.eye(2, dtype=np.float32) * KALMAN_MEAS_NOISE
+    return kf
+
+## @brief Restart the puck filter at a measured position with unknown velocity
+## @param kf Filter from make_puck_filter()
+## @param x Measured X position
+## @param y Measured Y position
+def reset_puck_filter(kf, x, y):
+    kf.statePost = np.array([[x], [y], [0.0], [0.0]], dtype=np.float32)
+    # Velocity uncertainty of ~10 pixels per frame, i.e. anything plausible
+    kf.errorCovPost = np.diag([KALMAN_MEAS_NOISE, KALMAN_MEAS_NOISE,
+                               100.0, 100.0]).astype(np.float32)
+
+## @brief Predict where a moving object crosses the target line
+## @details JIT-compiled with numba when available. Follows the object along
+##          (vx, vy), reflecting off at most one wall on the way. No fastmath:
+##          the NaN and inf sentinels must compare exactly.
+## @param x0 Initial X position
+## @param y0 Initial Y position
+## @param vx X velocity component (per frame)
+## @param vy Y velocity component (per frame)
+## @param W Table width
+## @param H Table height
+## @param y_target Y coordinate of the target line
+## @return Tuple (x_target, t_impact, x_bounce, y_bounce); t_impact is in
+##         frames. x_target and t_impact are NaN if the line is not reached,
+##         x_bounce and y_bounce are NaN if no wall is hit before the line.
+@njit(cache=True)
+def predict_target(x0, y0, vx, vy, W, H, y_target):
+    t1, xb, yb, vx2, vy2, _ = compute_first_bounce(x0, y0, vx, vy, W, H)
+
+    ## @brief Time to reach the target line on the direct path
+    # NaN when moving parallel to the line, so neither test below passes
+    t_direct = (y_target - y0) / vy if abs(vy) > 1e-3 else math.nan
+
+    # t1 is inf when no wall is hit
+    if t1 < t_direct:
+        ## @brief Small offset to avoid numerical issues at wall
+        eps = 1e-3
+        x1 = xb + vx2 * eps
+        y1 = yb + vy2 * eps
+        t2 = (y_target - y1) / vy2 if abs(vy2) > 1e-3 else math.nan
+        if t2 > 0:
+            return x1 + vx2 * t2, t1 + t2, xb, yb
+        return math.nan, math.nan, xb, yb
+    if t_direct > 0:
+        return x0 + vx * t_direct, t_direct, math.nan, math.nan
+    return math.nan, math.nan, math.nan, math.nan
+
+## @}
+
+# ------------------------------------------------------------------------------
+## @name Visualization Functions
+## @{
+# ------------------------------------------------------------------------------
+
+## @brief Round a point in table coordinates to integer pixel coordinates
+## @details Coordinates may be NumPy scalars, for which round() alone returns
+##          a float on NumPy 1.x, so the int() stays.
+## @param pt Point (x, y)
+## @return Tuple (x, y) of ints
+def to_pixel(pt):
+    return (int(round(pt[0])), int(round(pt[1])))
+
+## @brief Record a filled dot on the visualization
+## @param vis Draw list of the frame (see DisplayWindow), or None when running headless
+## @param pt Center point (x, y) in integer pixels, see to_pixel()
+## @param radius Dot radius in pixels
+## @param color BGR color tuple
+def draw_dot(vis, pt, radius, color):
+    if vis is None:
+        return
+    vis.append((cv2.circle, (pt, radius, color, -1)))
+
+## @brief Record a line segment on the visualization
+## @param vis Draw list of the frame (see DisplayWindow), or None when running headless
+## @param pt1 Start point (x, y) in integer pixels, see to_pixel()
+## @param pt2 End point (x, y) in integer pixels, see to_pixel()
+## @param color BGR color tuple
+## @param thickness Line thickness in pixels
+def draw_segment(vis, pt1, pt2, color, thickness):
+    if vis is None:
+        return
+    vis.append((cv2.line, (pt1, pt2, color, thickness)))
+
+## @brief Fold the interval since the previous event into a rate estimate
+## @details Exponential moving average of 1 / interval with FPS_EMA_ALPHA, so
+##          a stall shows up within a few events. The first interval seeds it.
+## @param rate Current estimate (events per second), 0.0 before the first interval
+## @param prev_time Time of the previous event, None for the first event
+## @param now Time of this event
+## @return Updated estimate
+def update_rate_ema(rate, prev_time, now):
+    if prev_time is None or now <= prev_time:
+        return rate
+    inst_rate = 1.0 / (now - prev_time)
+    if rate == 0.0:
+        return inst_rate
+    return rate + FPS_EMA_ALPHA * (inst_rate - rate)
+
+## @brief Rasterize a text label once and cache it
+## @details Labels repeat frame after frame, so the Hershey glyphs are drawn
+##          once into a mask and reused. putText's default 8-connected lines
+##          are not anti-aliased, so the mask reproduces its strokes exactly.
+## @param text Label text
+## @param scale Font scale
+## @param color BGR color tuple
+## @param thickness Stroke thickness in pixels
+## @return Tuple (image, mask, dx, dy): solid-color image and glyph mask, and
+##         the offset of the text origin inside them
+@functools.lru_cache(maxsize=32)
+def rendered_label(text, scale, color, thickness):
+    (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    # Some glyphs overhang the nominal text box, so draw with a generous margin
+    # and crop to the pixels actually set
+    pad = h + thickness
+    canvas = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+    cv2.putText(canvas, text, (pad, pad + h), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+    x, y, bw, bh = cv2.boundingRect(canvas)
+    mask = canvas[y:y + bh, x:x + bw].copy()
+    image = np.empty(mask.shape + (3,), dtype=np.uint8)
+    image[:] = color
+    return image, mask, pad - x, pad + h - y
+
+## @brief Draw a text label, equivalent to cv2.putText with FONT_HERSHEY_SIMPLEX
+## @param vis Image to draw on, or None when running headless
+## @param text Label text
+## @param org Bottom-left corner (x, y) of the text
+## @param scale Font scale
+## @param color BGR color tuple
+## @param thickness Stroke thickness in pixels
+def draw_label(vis, text, org, scale, color, thickness):
+    if vis is None:
+        return
+    image, mask, dx, dy = rendered_label(text, scale, tuple(color), thickness)
+    x0, y0 = org[0] - dx, org[1] - dy
+    # Clip the label to the image
+    lx0, ly0 = max(0, -x0), max(0, -y0)
+    lx1 = min(mask.shape[1], vis.shape[1] - x0)
+    ly1 = min(mask.shape[0], vis.shape[0] - y0)
+    if lx1 <= lx0 or ly1 <= ly0:
+        return
+    cv2.copyTo(image[ly0:ly1, lx0:lx1], mask[ly0:ly1, lx0:lx1],
+               vis[y0 + ly0:y0 + ly1, x0 + lx0:x0 + lx1])
+
+## @brief Show the table view in a window from a background thread
+## @details Rendering, imshow and the waitKey GUI pump run on a daemon thread
+##          so the detection loop never waits on them. The loop submits the
+##          raw frame together with a draw list: the (function, args) calls
+##          recorded by draw_dot(), draw_segment() and friends. Only the newest
+##          submission is kept, and the background image is built and the
+##          draw list replayed only for frames that are actually shown, so a
+##          frame dropped because the window lags costs no drawing at all.
+class DisplayWindow:
+    ## @brief Start the display thread
+    ## @param name Window title
+    ## @param background Function (frame, dst) -> image building the image
+    ##        the draw list is replayed onto; dst is the previous image (or
+    ##        None) for reuse as the output buffer
+    ## @param size Initial (width, height) of the window
+    def __init__(self, name, background, size=(800, 600)):
+        self.name = name
+        self.background = background
+        self.size = size
+        self.cond = threading.Condition()
+        self.pending = None
+        self.image = None   # Last rendered image, reused as the next buffer
+        ## @brief Set when the quit key is pressed in the window
+        self.quit = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    ## @brief Submit a frame to be shown, without blocking
+    ## @param frame Camera frame; it must not be modified afterwards
+    ## @param draw_list Recorded (function, args) draw calls for the frame
+    def show(self, frame, draw_list):
+        with self.cond:
+            self.pending = (frame, draw_list)  # Drops a frame not shown yet
+            self.cond.notify()
+
+    ## @brief Stop the display thread and close the window
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+
+    ## @brief Build the background image and replay a draw list onto it
+    ## @param frame Camera frame
+    ## @param draw_list Recorded (function, args) draw calls
+    ## @return Rendered image
+    def render(self, frame, draw_list):
+        self.image = self.background(frame, self.image)
+        for func, args in draw_list:
+            func(self.image, *args)
+        return self.image
+
+    ## @brief Display thread body: show the newest frame and pump GUI events
+    def _run(self):
+        cv2.namedWindow(self.name, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(self.name, *self.size)
+        while self.running:
+            with self.cond:
+                if self.pending is None:
+                    # Time out so the window keeps handling events while idle
+                    self.cond.wait(timeout=1.0 / FRAME_RATE)
+                pending, self.pending = self.pending, None
+            if pending is not None:
+                # The window is WINDOW_NORMAL, so the GUI backend scales the
+                # table view to the window size
+                cv2.imshow(self.name, self.render(*pending))
+            if cv2.waitKey(1) & 0xFF == QUIT_KEY:
+                self.quit.set()
+        cv2.destroyWindow(self.name)
 
 ## @}
 
@@ -476,25 +1112,47 @@ def compute_first_bounce(x0, y0, vx, vy, W, H):
 ##          - Physics-based trajectory prediction
 ##          - Aggressive behavior for stuck pucks
 ##          - Serial communication with table controller
-##          - Real-time visualization
-def main_loop():
-    global smoothed_puck, prev_smoothed_puck
+##          - Real-time visualization (skipped when headless)
+## @param headless If True, no window is opened and nothing is drawn
+## @param use_opencl If True, run warp/HSV/threshold/morphology through OpenCV's
+##        OpenCL T-API (cv2.UMat) when an OpenCL device is available
+## @param mask_mode "hsv" to threshold the calibrated HSV ranges, "red" to
+##        threshold R - max(G, B) on BGR (no HSV calibration needed)
+## @param decimate Detect objects only on every decimate-th camera frame (1 =
+##        every frame, at most MAX_DECIMATE); the frames in between extrapolate
+##        the puck with its filter and are otherwise processed as usual
+def main_loop(headless=False, use_opencl=False, mask_mode="hsv", decimate=1):
+    global smoothed_puck
 
     if not os.path.exists(FRAME_CALIB_FILE):
         print(f"ERROR: '{FRAME_CALIB_FILE}' missing. Run --mode calibrate_frame.")
         return
-    if not os.path.exists(HSV_CALIB_FILE):
+    red_mode = (mask_mode == "red")
+    if not red_mode and not os.path.exists(HSV_CALIB_FILE):
         print(f"ERROR: '{HSV_CALIB_FILE}' missing. Run --mode calibrate_hsv.")
         return
 
     warp_matrix, TABLE_W, TABLE_H = load_warp_matrix(FRAME_CALIB_FILE)
-    hsv_lower, hsv_upper         = load_hsv_ranges(HSV_CALIB_FILE)
+    if not red_mode:
+        hsv_lower, hsv_upper     = load_hsv_ranges(HSV_CALIB_FILE)
+    ## @brief Size of the downsampled detection image
+    DETECT_W, DETECT_H = TABLE_W // DETECT_SCALE, TABLE_H // DETECT_SCALE
 
     # 20% from top
     ## @brief Normal Y target position for robot (20% from top of table)
     y_target_normal = 0.2 * TABLE_H  # Store the normal Y target position
     ## @brief Current Y target position (can be overridden by aggressive mode)
     y_target = y_target_normal       # Current Y target (can be overridden by aggressive mode)
+    ## @brief Y coordinate of the table's halfway line
+    halfway_y = TABLE_H / 2.0
+    ## @brief Aim point of aggressive shots: centre of the opponent's goal
+    goal_x, goal_y = TABLE_W / 2.0, float(TABLE_H)
+    p_goal = to_pixel((goal_x, goal_y))
+    ## @brief Forward Y offset of the target during hit mode (table pixels)
+    hit_y_offset = 0.05 * TABLE_H
+    ## @brief Controller counts per table pixel, with the table size folded in
+    cmd_scale_x = CONTROLLER_X_RANGE / TABLE_W
+    cmd_scale_y = CONTROLLER_Y_RANGE / TABLE_H
 
     try:
         ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=0.1)
@@ -503,28 +1161,71 @@ def main_loop():
     except Exception as e:
         print(f"[WARN] Cannot open serial '{SERIAL_PORT}': {e}")
         ser = None
+    ## @brief Background command writer (None when serial is unavailable)
+    ser_writer = SerialWriter(ser) if ser is not None else None
 
-    cap = cv2.VideoCapture(0)
+    # Only the part of the frame that the warp reads is captured
+    cap = open_camera(roi=warp_source_roi(warp_matrix, TABLE_W, TABLE_H))
     if not cap.isOpened():
         print("ERROR: Cannot open camera for main loop.")
         return
+    # Capture the next frame while this one is processed
+    cap = FrameGrabber(cap)
+
+    ## @brief Fold the camera crop (if any) into the warp
+    frame_to_calib = getattr(cap, "frame_to_calib", None)
+    if frame_to_calib is not None:
+        warp_matrix = (warp_matrix @ frame_to_calib).astype(np.float32)
+    warp_map1, warp_map2         = build_warp_maps(warp_matrix, TABLE_W, TABLE_H)
+    detect_map1, detect_map2     = build_warp_maps(warp_matrix, TABLE_W, TABLE_H, DETECT_SCALE)
+
+    if use_opencl and not cv2.ocl.haveOpenCL():
+        print("[WARN] OpenCL not available, running detection on the CPU")
+        use_opencl = False
+    cv2.ocl.setUseOpenCL(use_opencl)
+    if use_opencl:
+        # Upload the remap tables once; they stay on the device for every frame
+        detect_map1, detect_map2 = cv2.UMat(detect_map1), cv2.UMat(detect_map2)
+        print("[OK] Detection running on OpenCL device: "
+              f"{cv2.ocl.Device.getDefault().name()}")
+
+    if headless:
+        print("\n== RUNNING DETECTION (headless): press Ctrl+C to quit ==\n")
+    else:
+        ## @brief Window showing the table view, updated on its own thread
+        display = DisplayWindow(
+            "AirHockey Detection",
+            lambda frame, dst: cv2.remap(frame, warp_map1, warp_map2, cv2.INTER_LINEAR, dst=dst))
+        print("\n== RUNNING DETECTION: press 'q' to quit ==\n")
 
-    win = "AirHockey Detection"
-    cv2.namedWindow(win, cv2.WINDOW_NORMAL)
-    cv2.resizeWindow(win, 800, 600)
-
-    print("\n== RUNNING DETECTION: press 'q' to quit ==\n")
+    ## @brief Compile (or load from cache) the prediction kernel up front
+    # with the argument types of the loop, so the first moving puck does
+    # not stall on the JIT
+    predict_target(0.0, 0.0, 0.0, 1.0, TABLE_W, TABLE_H, y_target)
 
     smoothed_puck = None
-    prev_smoothed_puck = None
-
-    # FPS counters
-    ## @brief Frame counter for FPS calculation
-    fps_count = 0
-    ## @brief Start time for FPS calculation
-    fps_start = time.time()
-    ## @brief Current FPS for display
+    ## @brief Constant-velocity Kalman filter tracking the puck
+    puck_filter = make_puck_filter()
+    ## @brief Measurement vector handed to the puck filter
+    puck_measurement = np.empty((2, 1), dtype=np.float32)
+    ## @brief Frames since the puck filter last received a measurement
+    puck_missed_frames = 0
+
+    # FPS estimate
+    ## @brief Timestamp of the previous frame, None before the first frame
+    prev_frame_time = None
+    ## @brief Exponentially averaged FPS, 0.0 until the second frame
     fps_display = 0.0
+    ## @brief Timestamp of the previous detection frame (differs with decimation)
+    prev_detect_time = None
+    ## @brief Exponentially averaged detection rate, 0.0 until the second detection
+    detect_fps_display = 0.0
+    ## @brief FPS overlay text, refreshed every FPS_LABEL_INTERVAL
+    fps_text = f"FPS: {fps_display:.1f}"
+    ## @brief Time the FPS overlay text was last refreshed
+    fps_text_time = 0.0
+    ## @brief Time of the last terminal status line (monotonic clock, far in the past)
+    last_print_time = 0.0
 
     # Hit mode tracking
     ## @brief Flag indicating if hit mode is currently active
@@ -562,72 +1263,201 @@ def main_loop():
     ## @brief Flag indicating if puck has crossed midline during follow-through
     puck_crossed_midline = False   # Flag to track if puck crossed midline
 
-    ## @brief Main detection and control loop
-    while True:
-        ## @brief Record start time for performance monitoring
-        loop_start = time.time()
-
-        ## @brief Capture frame from camera
-        ret, frame = cap.read()
-        if not ret:
-            continue
+    # Image buffers (allocated once and reused every frame)
+    ## @brief Downsampled bird's-eye view of the table used for detection
+    warped = np.empty((DETECT_H, DETECT_W, 3), dtype=np.uint8)
+    ## @brief HSV conversion of the downsampled table image
+    hsv = np.empty((DETECT_H, DETECT_W, 3), dtype=np.uint8)
+    ## @brief Binary HSV mask, cleaned in place before labelling
+    mask = np.empty((DETECT_H, DETECT_W), dtype=np.uint8)
+    ## @brief Structuring element for removing mask speckle
+    open_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    ## @brief Structuring element for growing objects by one pixel
+    grow_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+    ## @brief Connected component label image
+    labels = np.empty((DETECT_H, DETECT_W), dtype=np.int32)
+
+    ## @brief Window (y0, y1, x0, x1) covering the whole detection image
+    full_window = (0, DETECT_H, 0, DETECT_W)
+    ## @brief Detection windows around the tracked objects (empty = search the full image)
+    track_windows = []
+    ## @brief Frames processed since the last full-image detection
+    frames_since_full = 0
+
+    ## @brief Detect the two largest objects inside a window of the table
+    ## @param frame Camera frame
+    ## @param window (y0, y1, x0, x1) region of the detection image to search
+    ##        (the OpenCL path always searches the full image)
+    ## @return Up to two objects, largest first, each a tuple
+    ##         (area, (cx, cy), (x, y, w, h)) in detection-image coordinates
+    def detect_objects(frame, window):
+        y0, y1, x0, x1 = window
 
         ## @brief Apply perspective transformation to get bird's-eye view of table
         # This corrects for camera angle and gives us a top-down view
-        warped = cv2.warpPerspective(frame, warp_matrix, (TABLE_W, TABLE_H))
-        
-        ## @brief Convert to HSV color space for better color detection
-        # HSV is more robust to lighting changes than RGB
-        hsv = cv2.cvtColor(warped, cv2.COLOR_BGR2HSV)
-        
-        ## @brief Create binary mask using calibrated HSV ranges
-        # White pixels indicate detected objects (pucks/paddles)
-        mask = cv2.inRange(hsv, hsv_lower, hsv_upper)
+        # (lookup through the precomputed remap tables). Detection runs on a
+        # DETECT_SCALE-times smaller warp; the full-size warp is for display only.
+        # Slicing the remap tables warps just the window, and the buffer slices
+        # keep every later stage to the same window.
+        if use_opencl:
+            # Same warp -> threshold -> morphology chain on the OpenCL device;
+            # only the final single-channel mask is copied back for labelling
+            uwarped = cv2.remap(cv2.UMat(frame), detect_map1, detect_map2, cv2.INTER_LINEAR)
+            if red_mode:
+                umask = red_mask(uwarped, RED_THRESH)
+            else:
+                uhsv = cv2.cvtColor(uwarped, cv2.COLOR_BGR2HSV)
+                umask = cv2.inRange(uhsv, hsv_lower, hsv_upper)
+            umask = cv2.morphologyEx(umask, cv2.MORPH_OPEN, open_kernel)
+            win_mask = cv2.dilate(umask, grow_kernel).get()
+        else:
+            win_warped = warped[y0:y1, x0:x1]
+            win_hsv    = hsv[y0:y1, x0:x1]
+            win_mask   = mask[y0:y1, x0:x1]
+            cv2.remap(frame, detect_map1[y0:y1, x0:x1], detect_map2[y0:y1, x0:x1],
+                      cv2.INTER_LINEAR, dst=win_warped)
+
+            if red_mode:
+                ## @brief Create binary mask of red objects straight from BGR
+                red_mask(win_warped, RED_THRESH, dst=win_mask)
+            else:
+                ## @brief Convert to HSV color space for better color detection
+                # HSV is more robust to lighting changes than RGB
+                cv2.cvtColor(win_warped, cv2.COLOR_BGR2HSV, dst=win_hsv)
+
+                ## @brief Create binary mask using calibrated HSV ranges
+                # White pixels indicate detected objects (pucks/paddles)
+                cv2.inRange(win_hsv, hsv_lower, hsv_upper, dst=win_mask)
+
+            ## @brief Morphological open to remove isolated speckle pixels
+            # Objects are several pixels wide even at detection scale, so this
+            # only drops noise that would otherwise become tiny components
+            cv2.morphologyEx(win_mask, cv2.MORPH_OPEN, open_kernel, dst=win_mask)
+
+            ## @brief Grow objects by one pixel before labelling
+            # Objects are taken as non-zero regions of the mask, so this keeps
+            # the reach of the mask Gaussian blur: 5x5 at full resolution,
+            # rescaled to 3x3 at DETECT_SCALE 2, which shifts the mask outline
+            # by up to a detection pixel compared to the original blur
+            cv2.dilate(win_mask, grow_kernel, dst=win_mask)
+
+        ## @brief Skip labelling when no object can pass the area threshold
+        # Counting set pixels is far cheaper than labelling, and an empty
+        # table (puck occluded or off the table) is common
+        if cv2.countNonZero(win_mask) < DETECT_AREA_THRESH:
+            return []
+
+        ## @brief Label connected objects in the mask
+        # One pass yields every object's pixel area, bounding box and centroid
+        win_labels = labels[y0:y1, x0:x1]
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(
+            win_mask, labels=win_labels, connectivity=8, ltype=cv2.CV_32S)
+
+        ## @brief Filter objects by minimum area threshold
+        # Only keep objects large enough to be real (not noise); label 0 is background
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        candidates = np.flatnonzero(areas >= DETECT_AREA_THRESH)
+
+        ## @brief Select the two largest objects (largest first)
+        # Largest objects are most likely to be the puck and paddle; only the
+        # top two are used, so partition instead of sorting every candidate
+        if len(candidates) > 2:
+            candidates = candidates[np.argpartition(-areas[candidates], 2)[:2]]
+        candidates = candidates[np.argsort(-areas[candidates], kind="stable")]
+        return [(int(areas[i]),
+                 (centroids[i + 1, 0] + x0, centroids[i + 1, 1] + y0),
+                 (int(stats[i + 1, cv2.CC_STAT_LEFT]) + x0, int(stats[i + 1, cv2.CC_STAT_TOP]) + y0,
+                  int(stats[i + 1, cv2.CC_STAT_WIDTH]), int(stats[i + 1, cv2.CC_STAT_HEIGHT])))
+                for i in candidates]
+
+    ## @brief Camera frames read so far, for temporal decimation
+    frame_idx = 0
+    # Object classification of the latest detection, kept for the frames
+    # in between detections
+    handle_present = False
+    puck_present = False
+    handle_raw = None
+
+    # The loop ends on the quit key, Ctrl+C / SIGTERM, or an error; the
+    # cleanup runs in every case so the writer finishes its current command
+    try:
+        ## @brief Main detection and control loop
+        while True:
+            ## @brief Capture frame from camera
+            ret, frame = cap.read()
+            if not ret:
+                continue
 
-        ## @brief Apply Gaussian blur to reduce noise in the mask
-        # This helps eliminate small false detections
-        mask_blur = cv2.GaussianBlur(mask, (5, 5), 0)
-        
-        ## @brief Find contours of detected objects
-        # Contours represent the boundaries of detected objects
-        contours_data = cv2.findContours(mask_blur, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = contours_data[-2]  # works for both OpenCV 3.x and 4.x
-
-        ## @brief Filter contours by minimum area threshold
-        # Only keep contours large enough to be real objects (not noise)
-        valid = [c for c in contours if cv2.contourArea(c) >= AREA_THRESH]
-        
-        ## @brief Sort contours by area (largest first)
-        # Largest objects are most likely to be the puck and paddle
-        valid.sort(key=lambda c: cv2.contourArea(c), reverse=True)
+            ## @brief Timestamp of this frame, shared by every timer below
+            # Monotonic, so the mode timers are immune to wall-clock adjustments
+            now = time.monotonic()
+
+            ## @brief Temporal decimation: detect only on every decimate-th frame
+            # The frames in between skip detection and extrapolate the puck
+            detect_frame = frame_idx % decimate == 0
+            frame_idx += 1
+
+            if detect_frame:
+                ## @brief Detect objects, inside the tracking windows when possible
+                # Once both objects are found they move little between frames, so the
+                # next frame only searches around each of them. A miss in any window,
+                # or every TRACK_REFRESH_FRAMES frames, falls back to the full image.
+                # An object cut off by its window (a fast shot that outran the
+                # margin) counts as a miss, so its area and centroid are never
+                # taken from the clipped part.
+                valid = None
+                if track_windows and frames_since_full < TRACK_REFRESH_FRAMES:
+                    # Each window must hold its own object; a merged window holds both
+                    need = 2 if len(track_windows) == 1 else 1
+                    valid = []
+                    for window in track_windows:
+                        found = detect_objects(frame, window)[:need]
+                        if len(found) < need or any(
+                                touches_window_edge(box, window, DETECT_W, DETECT_H)
+                                for _, _, box in found):
+                            valid = None
+                            break
+                        valid += found
+                if valid is None:
+                    valid = detect_objects(frame, full_window)
+                    frames_since_full = 0
+                else:
+                    valid.sort(key=lambda obj: obj[0], reverse=True)
+                    frames_since_full += 1
 
-        ## @brief Create visualization image for debugging and display
-        vis = warped.copy()
+                if len(valid) == 2 and not use_opencl:
+                    track_windows = tracking_windows([box for _, _, box in valid],
+                                                     TRACK_MARGIN * decimate // DETECT_SCALE,
+                                                     DETECT_W, DETECT_H)
+                else:
+                    track_windows = []
+
+                ## @brief Scale the object centroids back to table coordinates
+                centers = [(cx * DETECT_SCALE, cy * DETECT_SCALE) for _, (cx, cy), _ in valid]
+
+            ## @brief Draw list for debugging and display
+            # Rendered by the display thread onto a full-size warp of the frame;
+            # None when headless so all drawing is skipped
+            vis = None if headless else []
         
-        ## @brief Initialize detection flags and prediction variables
-        handle_present = False      # True if paddle/handle detected
-        puck_present = False       # True if puck detected
-        x_target = None            # Predicted X position for robot to move to
-        time_until_impact = None   # Predicted time until puck reaches target line
-
-        ## @brief Object detection and classification logic
-        if len(valid) >= 1:
-            ## @brief Handle case with two or more objects detected
-            if len(valid) >= 2:
-                ## @brief Calculate centroids of the two largest objects
-                c0 = valid[0]  # Largest contour
-                c1 = valid[1]  # Second largest contour
-                M0 = cv2.moments(c0)
-                M1 = cv2.moments(c1)
-                
-                ## @brief Verify both objects have valid centroids
-                if M0["m00"] > 0 and M1["m00"] > 0:
-                    ## @brief Calculate centroid coordinates
-                    cx0 = M0["m10"] / M0["m00"]
-                    cy0 = M0["m01"] / M0["m00"]
-                    cx1 = M1["m10"] / M1["m00"]
-                    cy1 = M1["m01"] / M1["m00"]
-                    
+            ## @brief Initialize prediction variables
+            x_target = None            # Predicted X position for robot to move to
+            time_until_impact = None   # Predicted time until puck reaches target line
+            ## @brief True if the puck position below is current (measured or extrapolated)
+            puck_tracked = False
+
+            ## @brief Object detection and classification logic
+            if detect_frame:
+                handle_present = False      # True if paddle/handle detected
+                puck_present = False       # True if puck detected
+
+            if detect_frame and len(centers) >= 1:
+                ## @brief Handle case with two or more objects detected
+                if len(centers) >= 2:
+                    ## @brief Centroids of the two largest objects
+                    cx0, cy0 = centers[0]  # Largest object
+                    cx1, cy1 = centers[1]  # Second largest object
+
                     ## @brief Classify objects based on Y position
                     # Object closer to robot (smaller Y) is likely the puck
                     # Object farther from robot (larger Y) is likely the handle/paddle
@@ -639,543 +1469,332 @@ def main_loop():
                         handle_raw = (cx0, cy0)    # Object 0 is handle
                     handle_present = True
                 else:
-                    ## @brief Handle case where one centroid calculation failed
+                    ## @brief Handle case with single object detected
+                    puck_raw = centers[0]
                     handle_raw = None
-                    if M0["m00"] > 0:
-                        puck_raw = (M0["m10"] / M0["m00"], M0["m01"] / M0["m00"])
-                    elif M1["m00"] > 0:
-                        puck_raw = (M1["m10"] / M1["m00"], M1["m01"] / M1["m00"])
-                    else:
-                        puck_raw = (0.0, 0.0)
                     puck_present = True
-            else:
-                ## @brief Handle case with single object detected
-                c = valid[0]
-                M = cv2.moments(c)
-                if M["m00"] > 0:
-                    puck_raw = (M["m10"] / M["m00"], M["m01"] / M["m00"])
-                else:
-                    puck_raw = (0.0, 0.0)
-                handle_raw = None
-                puck_present = True
-
-            ## @brief Apply exponential smoothing to puck position
-            # This reduces jitter and noise in position measurements
-            if smoothed_puck is None:
-                # First detection - no smoothing needed
-                smoothed_puck = puck_raw
-            else:
-                # Apply exponential smoothing filter
-                # New position = α * raw_position + (1-α) * previous_smooth_position
-                smoothed_puck = (
-                    SMOOTHING_ALPHA * puck_raw[0] + (1 - SMOOTHING_ALPHA) * smoothed_puck[0],
-                    SMOOTHING_ALPHA * puck_raw[1] + (1 - SMOOTHING_ALPHA) * smoothed_puck[1]
-                )
-
-            ## @brief Calculate puck velocity from position history
-            if prev_smoothed_puck is not None:
-                # Velocity = change in position per frame
-                vx = smoothed_puck[0] - prev_smoothed_puck[0]
-                vy = smoothed_puck[1] - prev_smoothed_puck[1]
-            else:
-                # No previous position available
-                vx, vy = 0.0, 0.0
-            
-            ## @brief Store current position for next frame's velocity calculation
-            prev_smoothed_puck = smoothed_puck
-
-            ## @brief Draw puck position on visualization
-            xp, yp = int(round(smoothed_puck[0])), int(round(smoothed_puck[1]))
-            cv2.circle(vis, (xp, yp), 6, (255, 255, 0), -1)  # Cyan dot for puck
-
-            ## @brief Two-object prediction mode (puck + handle detected)
-            if handle_present:
-                ## @brief Draw handle position on visualization
-                xh, yh = int(round(handle_raw[0])), int(round(handle_raw[1]))
-                cv2.circle(vis, (xh, yh), 6, (0, 255, 0), -1)  # Green dot for handle
-
-                ## @brief Draw vector from handle to puck
-                cv2.line(vis, (xh, yh), (xp, yp), (0, 255, 255), 2)  # Yellow line
-
-                ## @brief Check if puck has sufficient velocity for physics prediction
-                puck_vel_mag = math.hypot(vx, vy)
-                use_puck_velocity = puck_vel_mag > VEL_THRESHOLD
 
+                ## @brief Filter puck position and velocity
+                # The Kalman filter reduces jitter without the lag of exponential
+                # smoothing, and estimates velocity jointly instead of differencing
+                if smoothed_puck is None or puck_missed_frames > KALMAN_MAX_MISSED:
+                    # First detection, or puck lost for too long - start over at rest
+                    reset_puck_filter(puck_filter, puck_raw[0], puck_raw[1])
+                    state = puck_filter.statePost
+                else:
+                    # One prediction per frame since the last measurement, so the
+                    # filter coasts over frames where the puck was not seen
+                    for _ in range(puck_missed_frames + 1):
+                        puck_filter.predict()
+                    puck_measurement[0, 0], puck_measurement[1, 0] = puck_raw
+                    state = puck_filter.correct(puck_measurement)
+                puck_missed_frames = 0
+                puck_tracked = True
+            elif detect_frame:
+                ## @brief Nothing detected: the puck filter coasts until the next detection
+                puck_missed_frames += 1
+            elif smoothed_puck is not None:
+                ## @brief No detection on this frame: advance the filter one frame
+                # The filter keeps one prediction per camera frame either way;
+                # the puck is only extrapolated while the last detection saw it
+                state = puck_filter.predict()
+                puck_tracked = puck_missed_frames == 0
+
+            if puck_tracked:
+                ## @brief Filtered position and velocity (pixels per frame)
+                smoothed_puck = (float(state[0, 0]), float(state[1, 0]))
+                vx, vy = float(state[2, 0]), float(state[3, 0])
+
+                ## @brief Draw puck position on visualization
+                p_puck = to_pixel(smoothed_puck)
+                draw_dot(vis, p_puck, 6, (255, 255, 0))  # Cyan dot for puck
+
+                ## @brief Draw the handle when two objects are detected
+                if handle_present:
+                    ## @brief Draw handle position on visualization
+                    p_handle = to_pixel(handle_raw)
+                    draw_dot(vis, p_handle, 6, (0, 255, 0))  # Green dot for handle
+
+                    ## @brief Draw vector from handle to puck
+                    draw_segment(vis, p_handle, p_puck, (0, 255, 255), 2)  # Yellow line
+
+                ## @brief Choose the direction to predict the puck's path along
+                use_puck_velocity = vx * vx + vy * vy > VEL_THRESHOLD_SQ
+                x0, y0 = smoothed_puck
                 if use_puck_velocity:
                     ## @brief Use physics-based prediction with puck velocity
-                    x0, y0 = smoothed_puck
-                    
-                    ## @brief Calculate potential wall bounce
-                    fb = compute_first_bounce(x0, y0, vx, vy, TABLE_W, TABLE_H)
-                    
-                    ## @brief Calculate direct path to target line
-                    if abs(vy) > 1e-3:
-                        t_direct = (y_target - y0) / vy
-                    else:
-                        t_direct = None
-
-                    ## @brief Determine if bounce occurs before reaching target
-                    need_bounce = False
-                    if fb is not None and t_direct is not None:
-                        t1, xh1, yh1, w1 = fb
-                        if t1 > 0 and t1 < t_direct:
-                            need_bounce = True
-
-                    if need_bounce:
-                        ## @brief Handle trajectory with wall bounce
-                        t1, xh1, yh1, w1 = fb
-                        
-                        ## @brief Draw path to bounce point
-                        cv2.line(vis, (xp, yp), 
-                               (int(round(xh1)), int(round(yh1))), 
-                               (0, 255, 255), 2)  # Yellow line to bounce
-                        cv2.circle(vis, (int(round(xh1)), int(round(yh1))), 
-                                 6, (255, 0, 0), -1)  # Blue dot at bounce
-
-                        ## @brief Calculate reflected velocity after bounce
-                        vx2, vy2 = reflect_vector(vx, vy, w1)
-                        
-                        ## @brief Small offset to avoid numerical issues at wall
-                        eps = 1e-3
-                        x1 = xh1 + vx2 * eps
-                        y1 = yh1 + vy2 * eps
-                        
-                        ## @brief Calculate time from bounce to target line
-                        if abs(vy2) > 1e-3:
-                            t2 = (y_target - y1) / vy2
-                        else:
-                            t2 = None
-
-                        if t2 is not None and t2 > 0:
-                            ## @brief Calculate final target position after bounce
-                            x_target = x1 + vx2 * t2
-                            
-                            ## @brief Draw path from bounce to target
-                            cv2.line(vis, (int(round(xh1)), int(round(yh1))),
-                                   (int(round(x_target)), int(round(y_target))),
-                                   (255, 0, 255), 2)  # Magenta line after bounce
-                            cv2.circle(vis, (int(round(x_target)), int(round(y_target))),
-                                     6, (0, 0, 255), -1)  # Red dot at target
-                            
-                            ## @brief Calculate total time until impact
-                            time_until_impact = (t1 + t2) / FRAME_RATE
-                        else:
-                            ## @brief Handle direct trajectory (no bounce)
-                            if t_direct is not None and t_direct > 0:
-                                ## @brief Calculate direct target position
-                                x_target = x0 + vx * t_direct
-                                
-                                ## @brief Draw direct path to target
-                                cv2.line(vis, (xp, yp),
-                                       (int(round(x_target)), int(round(y_target))),
-                                       (0, 255, 255), 2)  # Yellow direct line
-                                cv2.circle(vis, (int(round(x_target)), int(round(y_target))),
-                                         6, (0, 0, 255), -1)  # Red dot at target
-                                
-                                ## @brief Calculate time until impact
-                                time_until_impact = t_direct / FRAME_RATE
-                    else:
-                        ## @brief Use handle-to-puck vector prediction (low velocity case)
-                        # When puck isn't moving much, predict based on handle direction
-                        x0, y0 = smoothed_puck
-                        
-                        ## @brief Calculate vector from handle to puck
-                        vx_hp = x0 - handle_raw[0]
-                        vy_hp = y0 - handle_raw[1]
-
-                        ## @brief Calculate intersection with target line
-                        if abs(vy_hp) > 1e-3:
-                            t_direct = (y_target - y0) / vy_hp
-                        else:
-                            t_direct = None
-
-                        ## @brief Check for wall bounce along handle-puck vector
-                        fb = compute_first_bounce(x0, y0, vx_hp, vy_hp, TABLE_W, TABLE_H)
-                        need_bounce = False
-                        if fb is not None and t_direct is not None:
-                            t1, xh1, yh1, w1 = fb
-                            if t1 > 0 and t1 < t_direct:
-                                need_bounce = True
-
-                        if need_bounce:
-                            ## @brief Handle bounce case for handle-puck vector
-                            t1, xh1, yh1, w1 = fb
-                            
-                            ## @brief Draw path to bounce point
-                            cv2.line(vis, (xp, yp),
-                                   (int(round(xh1)), int(round(yh1))), 
-                                   (0, 255, 255), 2)
-                            cv2.circle(vis, (int(round(xh1)), int(round(yh1))),
-                                     6, (255, 0, 0), -1)  # Blue dot at bounce
-
-                            ## @brief Calculate reflection and final target
-                            vx2, vy2 = reflect_vector(vx_hp, vy_hp, w1)
-                            eps = 1e-3
-                            x1 = xh1 + vx2 * eps
-                            y1 = yh1 + vy2 * eps
-
-                            if abs(vy2) > 1e-3:
-                                t2 = (y_target - y1) / vy2
-                            else:
-                                t2 = None
-
-                            if t2 is not None and t2 > 0:
-                                x_target = x1 + vx2 * t2
-                                cv2.line(vis, (int(round(xh1)), int(round(yh1))),
-                                       (int(round(x_target)), int(round(y_target))),
-                                       (255, 0, 255), 2)  # Magenta
-                                cv2.circle(vis, (int(round(x_target)), int(round(y_target))),
-                                         6, (0, 0, 255), -1)  # Red
-                        else:
-                            ## @brief Direct path case for handle-puck vector
-                            if t_direct is not None:
-                                x_target = x0 + vx_hp * t_direct
-                            else:
-                                x_target = x0
-                            cv2.line(vis, (xp, yp),
-                                   (int(round(x_target)), int(round(y_target))),
-                                   (0, 255, 255), 2)  # Yellow
-                            cv2.circle(vis, (int(round(x_target)), int(round(y_target))),
-                                     6, (0, 0, 255), -1)  # Red
+                    dir_x, dir_y = vx, vy
+                elif handle_present:
+                    ## @brief Use handle-to-puck vector prediction (low velocity case)
+                    # When puck isn't moving much, predict based on handle direction
+                    dir_x, dir_y = x0 - handle_raw[0], y0 - handle_raw[1]
+                else:
+                    ## @brief No prediction when puck velocity is too low
+                    # Avoid making predictions when puck is stationary or moving very slowly
+                    dir_x = dir_y = None
 
-            else:
-                ## @brief Single-puck prediction mode (only puck detected)
-                mag = math.hypot(vx, vy)
-                if (mag > VEL_THRESHOLD):
-                    ## @brief Use physics prediction only if puck has significant velocity
-                    x0, y0 = smoothed_puck
-                    
-                    ## @brief Calculate potential wall bounce
-                    fb = compute_first_bounce(x0, y0, vx, vy, TABLE_W, TABLE_H)
-                    
-                    ## @brief Calculate direct path time
-                    if abs(vy) > 1e-3:
-                        t_direct = (y_target - y0) / vy
-                    else:
-                        t_direct = None
-
-                    ## @brief Check if bounce occurs before target
-                    need_bounce = False
-                    if fb is not None and t_direct is not None:
-                        t1, xh1, yh1, w1 = fb
-                        if t1 > 0 and t1 < t_direct:
-                            need_bounce = True
-
-                    if need_bounce:
-                        ## @brief Handle bounce trajectory for single puck
-                        t1, xh1, yh1, w1 = fb
-                        cv2.line(vis, (xp, yp),
-                               (int(round(xh1)), int(round(yh1))),
-                               (0, 255, 255), 2)  # Yellow to bounce
-                        cv2.circle(vis, (int(round(xh1)), int(round(yh1))),
-                                 6, (255, 0, 0), -1)  # Blue at bounce
-
-                        vx2, vy2 = reflect_vector(vx, vy, w1)
-                        eps = 1e-3
-                        x1 = xh1 + vx2 * eps
-                        y1 = yh1 + vy2 * eps
-                        if abs(vy2) > 1e-3:
-                            t2 = (y_target - y1) / vy2
-                        else:
-                            t2 = None
-
-                        if t2 is not None and t2 > 0:
-                            x_target = x1 + vx2 * t2
-                            cv2.line(vis, (int(round(xh1)), int(round(yh1))),
-                                   (int(round(x_target)), int(round(y_target))),
-                                   (255, 0, 255), 2)  # Magenta after bounce
-                            cv2.circle(vis, (int(round(x_target)), int(round(y_target))),
-                                     6, (0, 0, 255), -1)  # Red at target
-                            time_until_impact = (t1 + t2) / FRAME_RATE
+                if dir_x is not None:
+                    xt, t_impact, xb, yb = predict_target(x0, y0, dir_x, dir_y, TABLE_W, TABLE_H, y_target)
+
+                    if not math.isnan(xb):
+                        ## @brief Draw path to bounce point
+                        p_bounce = to_pixel((xb, yb))
+                        draw_segment(vis, p_puck, p_bounce, (0, 255, 255), 2)  # Yellow line to bounce
+                        draw_dot(vis, p_bounce, 6, (255, 0, 0))  # Blue dot at bounce
+                    elif math.isnan(xt) and not use_puck_velocity:
+                        # Block at the puck's X when the handle vector never reaches the line
+                        xt = x0
+
+                    if not math.isnan(xt):
+                        x_target = xt
+                        ## @brief Draw path from bounce (or puck) to target
+                        p_target = to_pixel((x_target, y_target))
+                        if math.isnan(xb):
+                            draw_segment(vis, p_puck, p_target, (0, 255, 255), 2)  # Yellow direct line
                         else:
-                            ## @brief Handle direct trajectory for single puck
-                            if t_direct is not None and t_direct > 0:
-                                x_target = x0 + vx * t_direct
-                                cv2.line(vis, (xp, yp),
-                                       (int(round(x_target)), int(round(y_target))),
-                                       (0, 255, 255), 2)  # Yellow direct
-                                cv2.circle(vis, (int(round(x_target)), int(round(y_target))),
-                                         6, (0, 0, 255), -1)  # Red at target
-                                time_until_impact = t_direct / FRAME_RATE
-                    else:
-                        ## @brief No prediction when puck velocity is too low
-                        # Avoid making predictions when puck is stationary or moving very slowly
-                        x_target = None
-                        time_until_impact = None
-
-        ## @brief Aggressive behavior state machine for stuck pucks
-        # Check if puck is in robot's half (top half) and update timer
-        if puck_present and smoothed_puck:
-            halfway_y = TABLE_H / 2.0
-            current_time = time.time()
-            
-            ## @brief Track if puck crosses midline during follow-through
-            if aggressive_mode_active and aggressive_phase == 3:
-                if smoothed_puck[1] > halfway_y:
-                    puck_crossed_midline = True
+                            draw_segment(vis, p_bounce, p_target, (255, 0, 255), 2)  # Magenta line after bounce
+                        draw_dot(vis, p_target, 6, (0, 0, 255))  # Red dot at target
+
+                        ## @brief Calculate total time until impact
+                        # The handle vector has no time scale, so only a moving puck is timed
+                        if use_puck_velocity:
+                            time_until_impact = t_impact / FRAME_RATE
+
+            ## @brief Aggressive behavior state machine for stuck pucks
+            # Check if puck is in robot's half (top half) and update timer
+            if puck_present and smoothed_puck:
+                ## @brief Track if puck crosses midline during follow-through
+                if aggressive_mode_active and aggressive_phase == 3:
+                    if smoothed_puck[1] > halfway_y:
+                        puck_crossed_midline = True
             
-            ## @brief Monitor puck position relative to table center
-            if smoothed_puck[1] < halfway_y:
-                ## @brief Puck is in robot's territory (top half)
-                if not puck_in_robot_half:
-                    ## @brief Puck just entered robot's half - start timer
-                    puck_in_robot_half = True
-                    puck_in_robot_half_start_time = current_time
-                    puck_crossed_midline = False  # Reset crossing flag
-                elif not aggressive_mode_active and (current_time - puck_in_robot_half_start_time) > PUCK_IN_ROBOT_HALF_THRESHOLD:
-                    ## @brief Puck stuck in robot's half - activate aggressive mode
-                    aggressive_mode_active = True
-                    aggressive_mode_start_time = current_time
-                    aggressive_phase = 1  # Start with positioning phase
-                    aggressive_phase_start_time = current_time
-                    puck_crossed_midline = False
-                    print("AGGRESSIVE MODE ACTIVATED - POSITIONING PHASE")
-            else:
-                ## @brief Puck is in human's territory (bottom half) - reset timer
-                puck_in_robot_half = False
+                ## @brief Monitor puck position relative to table center
+                if smoothed_puck[1] < halfway_y:
+                    ## @brief Puck is in robot's territory (top half)
+                    if not puck_in_robot_half:
+                        ## @brief Puck just entered robot's half - start timer
+                        puck_in_robot_half = True
+                        puck_in_robot_half_start_time = now
+                        puck_crossed_midline = False  # Reset crossing flag
+                    elif not aggressive_mode_active and (now - puck_in_robot_half_start_time) > PUCK_IN_ROBOT_HALF_THRESHOLD:
+                        ## @brief Puck stuck in robot's half - activate aggressive mode
+                        aggressive_mode_active = True
+                        aggressive_mode_start_time = now
+                        aggressive_phase = 1  # Start with positioning phase
+                        aggressive_phase_start_time = now
+                        puck_crossed_midline = False
+                        print("AGGRESSIVE MODE ACTIVATED - POSITIONING PHASE")
+                else:
+                    ## @brief Puck is in human's territory (bottom half) - reset timer
+                    puck_in_robot_half = False
             
-            ## @brief Aggressive mode phase transitions
-            if aggressive_mode_active:
-                ## @brief Phase 1 → Phase 2: Positioning → Striking
-                if aggressive_phase == 1 and (current_time - aggressive_phase_start_time) > 1.0:
-                    aggressive_phase = 2
-                    aggressive_phase_start_time = current_time
-                    print("AGGRESSIVE MODE - STRIKING PHASE")
-                ## @brief Phase 2 → Phase 3: Striking → Follow-through
-                elif aggressive_phase == 2 and (current_time - aggressive_phase_start_time) > 0.2:
-                    aggressive_phase = 3
-                    aggressive_phase_start_time = current_time
-                    puck_crossed_midline = False
-                    print("AGGRESSIVE MODE - FOLLOW-THROUGH PHASE (until puck crosses midline)")
-                ## @brief Phase 3 → End: Follow-through → Normal operation
-                elif aggressive_phase == 3 and (puck_crossed_midline or 
-                                             (current_time - aggressive_phase_start_time) > FOLLOW_THROUGH_TIMEOUT):
-                    aggressive_mode_active = False
-                    aggressive_phase = 0
-                    y_target = y_target_normal  # Reset Y position to normal
-                    if puck_crossed_midline:
-                        print("Aggressive mode complete - puck crossed midline, returning to normal Y position")
-                    else:
-                        print("Aggressive mode complete - follow-through timeout (10s), returning to normal Y position")
+                ## @brief Aggressive mode phase transitions
+                if aggressive_mode_active:
+                    ## @brief Phase 1 → Phase 2: Positioning → Striking
+                    if aggressive_phase == 1 and (now - aggressive_phase_start_time) > 1.0:
+                        aggressive_phase = 2
+                        aggressive_phase_start_time = now
+                        print("AGGRESSIVE MODE - STRIKING PHASE")
+                    ## @brief Phase 2 → Phase 3: Striking → Follow-through
+                    elif aggressive_phase == 2 and (now - aggressive_phase_start_time) > 0.2:
+                        aggressive_phase = 3
+                        aggressive_phase_start_time = now
+                        puck_crossed_midline = False
+                        print("AGGRESSIVE MODE - FOLLOW-THROUGH PHASE (until puck crosses midline)")
+                    ## @brief Phase 3 → End: Follow-through → Normal operation
+                    elif aggressive_phase == 3 and (puck_crossed_midline or 
+                                                 (now - aggressive_phase_start_time) > FOLLOW_THROUGH_TIMEOUT):
+                        aggressive_mode_active = False
+                        aggressive_phase = 0
+                        y_target = y_target_normal  # Reset Y position to normal
+                        if puck_crossed_midline:
+                            print("Aggressive mode complete - puck crossed midline, returning to normal Y position")
+                        else:
+                            print("Aggressive mode complete - follow-through timeout (10s), returning to normal Y position")
                 
-                ## @brief Override normal prediction with aggressive behavior
-                if aggressive_mode_active and puck_present:
-                    ## @brief Define target goal for aggressive shot
-                    goal_x = TABLE_W / 2.0  # Center of opponent's goal
-                    goal_y = TABLE_H        # Bottom of table (opponent's end)
-                    
-                    ## @brief Calculate vector from puck to goal
-                    puck_x, puck_y = smoothed_puck
-                    goal_vector_x = goal_x - puck_x
-                    goal_vector_y = goal_y - puck_y
-                    
-                    ## @brief Normalize the goal vector
-                    vector_length = math.hypot(goal_vector_x, goal_vector_y)
-                    if vector_length > 1e-3:
-                        norm_vector_x = goal_vector_x / vector_length
-                        norm_vector_y = goal_vector_y / vector_length
-                        
+                    ## @brief Override normal prediction with aggressive behavior
+                    if aggressive_mode_active and puck_present:
+                        ## @brief Vector from puck to the opponent's goal
+                        puck_x, puck_y = smoothed_puck
+                        goal_vector_x = goal_x - puck_x
+                        goal_vector_y = goal_y - puck_y
+
+                        # The aim lines below intersect the puck-to-goal line with a
+                        # horizontal line, so only the slope dx/dy is needed and the
+                        # vector never has to be normalized
+                        if abs(goal_vector_y) > 1e-3:
+                            goal_slope = goal_vector_x / goal_vector_y
+                        else:
+                            goal_slope = None  # Horizontal vector
+
                         ## @brief Phase 1: Position at intercept point
                         if aggressive_phase == 1:
                             ## @brief Find where puck-to-goal vector crosses robot's Y line
-                            if abs(norm_vector_y) > 1e-3:  # Avoid division by zero
-                                t = (y_target_normal - puck_y) / norm_vector_y
-                                x_target = puck_x + norm_vector_x * t
+                            if goal_slope is not None:
+                                x_target = puck_x + goal_slope * (y_target_normal - puck_y)
                                 x_target = max(0, min(x_target, TABLE_W))  # Keep in bounds
-                                time_until_impact = None  # Not striking yet
                             else:
                                 ## @brief Handle horizontal vectors
                                 x_target = puck_x
-                                time_until_impact = None
-                        
+                            time_until_impact = None  # Not striking yet
+
                         ## @brief Phase 2: Strike toward halfway point
                         elif aggressive_phase == 2:
-                            ## @brief Calculate strike point to reach table center
-                            halfway_point = TABLE_H / 2.0
-                            
-                            if abs(norm_vector_y) > 1e-3:
-                                ## @brief Find where vector intersects halfway line
-                                t_halfway = (halfway_point - puck_y) / norm_vector_y
-                                
-                                ## @brief Calculate target position at halfway point
-                                x_target = puck_x + norm_vector_x * t_halfway
-                                strike_y_target = puck_y + norm_vector_y * t_halfway
-                                
-                                ## @brief Ensure targets stay within table bounds
-                                x_target = max(0, min(x_target, TABLE_W))
-                                strike_y_target = max(0, min(strike_y_target, TABLE_H))
-                                
-                                time_until_impact = 0.2  # Quick strike movement
-                                
-                                ## @brief Store positions for follow-through phase
-                                last_strike_x_target = x_target
-                                last_strike_y_target = strike_y_target
+                            if goal_slope is not None:
+                                ## @brief Target where the vector crosses the halfway line
+                                x_target = puck_x + goal_slope * (halfway_y - puck_y)
+                                x_target = max(0, min(x_target, TABLE_W))  # Keep in bounds
                             else:
                                 ## @brief Handle horizontal vectors - strike toward center
                                 x_target = TABLE_W / 2.0
-                                strike_y_target = halfway_point
-                                time_until_impact = 0.2
-                                last_strike_x_target = x_target
-                                last_strike_y_target = strike_y_target
-                        
+                            strike_y_target = halfway_y
+                            time_until_impact = 0.2  # Quick strike movement
+
+                            ## @brief Store positions for follow-through phase
+                            last_strike_x_target = x_target
+                            last_strike_y_target = strike_y_target
+
                         ## @brief Phase 3: Follow through - maintain strike position
                         elif aggressive_phase == 3 and last_strike_x_target is not None:
                             ## @brief Hold extended position for momentum and power
                             x_target = last_strike_x_target
                             y_target = last_strike_y_target  # Override normal Y position
                             time_until_impact = None  # No timing needed for follow-through
-                        
-                        ## @brief Visualization for aggressive mode
-                        if aggressive_phase == 1:
-                            mode_text = "POSITION"
-                        elif aggressive_phase == 2:
-                            mode_text = "STRIKE"
-                        else:
-                            mode_text = "FOLLOW"
-                        
-                        ## @brief Draw puck-to-goal vector
-                        cv2.line(vis, (int(round(puck_x)), int(round(puck_y))),
-                               (int(round(goal_x)), int(round(goal_y))),
-                               (255, 0, 255), 1)  # Thin magenta line to goal
-                        
-                        ## @brief Draw robot target position
-                        cv2.line(vis, (int(round(puck_x)), int(round(puck_y))),
-                               (int(round(x_target)), int(round(y_target))),
-                               (0, 0, 255), 3)  # Thick red line for aggressive target
-                        cv2.circle(vis, (int(round(x_target)), int(round(y_target))),
-                                 8, (0, 0, 255), -1)  # Large red dot
-                        
+
+                        ## @brief Visualization for aggressive mode (the mode label is drawn below)
+                        if vis is not None:
+                            ## @brief Draw puck-to-goal vector
+                            p_puck = to_pixel((puck_x, puck_y))
+                            draw_segment(vis, p_puck, p_goal, (255, 0, 255), 1)  # Thin magenta line to goal
+
+                            ## @brief Draw robot target position
+                            # Skip the line when the target sits on the puck (nothing to draw)
+                            p_target = to_pixel((x_target, y_target))
+                            if p_target != p_puck:
+                                draw_segment(vis, p_puck, p_target, (0, 0, 255), 3)  # Thick red line for aggressive target
+                            draw_dot(vis, p_target, 8, (0, 0, 255))  # Large red dot
+                    
                         ## @brief Disable normal hit mode during aggressive behavior
                         hit_mode_active = False
 
-        ## @brief Update FPS counter for performance monitoring
-        fps_count += 1
-        now = time.time()
-        elapsed = now - fps_start
-        if elapsed >= 1.0:
-            fps_display = fps_count / elapsed
-            fps_count = 0
-            fps_start = now
+            ## @brief Update FPS estimate for performance monitoring
+            # EMA of the per-frame rate: reacts to a stall within a few frames
+            # instead of averaging it into a one-second window
+            fps_display = update_rate_ema(fps_display, prev_frame_time, now)
+            prev_frame_time = now
+            # Every frame is processed, but with decimation only every Nth one
+            # is a detection, so that rate is tracked and shown separately
+            if detect_frame:
+                detect_fps_display = update_rate_ema(detect_fps_display, prev_detect_time, now)
+                prev_detect_time = now
+            # The label changes far less often than the estimate, so it stays
+            # readable and its rendered_label cache entry is reused
+            if now - fps_text_time >= FPS_LABEL_INTERVAL:
+                fps_text = f"FPS: {fps_display:.1f}"
+                if decimate > 1:
+                    fps_text += f" (det {detect_fps_display:.1f})"
+                fps_text_time = now
             
-        ## @brief Hit mode state management
-        # Send command over serial on every frame if we have a valid target
-        if x_target is not None and ser is not None:
-            try:
-                ## @brief Determine if hit mode should be activated
-                hit_mode_trigger = (time_until_impact is not None and time_until_impact < 0.4) or \
-                            (puck_present and smoothed_puck and abs(smoothed_puck[1] - y_target) < TABLE_H * 0.15)
-                
-                current_time = time.time()
-                
-                ## @brief Activate hit mode and set timer
-                if hit_mode_trigger:
-                    hit_mode_active = True
-                    hit_mode_start_time = current_time
-                
-                ## @brief Check if hit mode should expire
-                if hit_mode_active and (current_time - hit_mode_start_time) > HIT_MODE_DURATION:
-                    hit_mode_active = False
-                
-                ## @brief Use hit mode state for position adjustment
-                in_hit_mode = hit_mode_active
+            ## @brief Hit mode state management
+            # Send command over serial on every frame if we have a valid target
+            if x_target is not None and ser is not None:
+                try:
+                    ## @brief Determine if hit mode should be activated
+                    hit_mode_trigger = (time_until_impact is not None and time_until_impact < 0.4) or \
+                                (puck_present and smoothed_puck and abs(smoothed_puck[1] - y_target) < TABLE_H * 0.15)
                 
-                ## @brief Calculate table coordinate percentages
-                table_width = float(TABLE_W)
-                adjusted_x_target = x_target
+                    ## @brief Activate hit mode and set timer
+                    if hit_mode_trigger:
+                        hit_mode_active = True
+                        hit_mode_start_time = now
                 
-                ## @brief Y target adjustment for hit mode
-                y_target_adder = 0.0
-                if in_hit_mode:
-                    # Move slightly forward during hit mode for better contact
-                    y_target_adder = 0.05 * TABLE_H
-
-                ## @brief Convert to percentage coordinates (0.0 to 1.0)
-                percent_x = x_target / TABLE_W
-                percent_y = (y_target + y_target_adder) / TABLE_H
-
-                ## @brief Clamp percentages to valid range
-                percent_x = max(percent_x, 0.0)
-                percent_x = min(percent_x, 1.0)
-                percent_y = max(percent_y, 0.0)
-                percent_y = min(percent_y, 1.0)
-
-                ## @brief Scale to controller coordinate system
-                # Controller expects coordinates scaled to specific ranges
-                scaled_x = int((percent_x) * 2857)
-                scaled_y = int((percent_y) * 4873)             
-                
-                ## @brief Format command for serial transmission
-                # Command format: MXXXXYYYY where XXXX and YYYY are 4-digit coordinates
-                msg = f"M{scaled_x:04d}{scaled_y:04d}\r\n"
+                    ## @brief Check if hit mode should expire
+                    if hit_mode_active and (now - hit_mode_start_time) > HIT_MODE_DURATION:
+                        hit_mode_active = False
                 
-                ## @brief Send command byte-by-byte with delays
-                # Small delays help prevent buffer overruns on the controller
-                for byte in msg.encode('ascii'):
-                    ser.write(bytes([byte]))  # Send single byte
-                    time.sleep(0.001)  # 1ms delay between bytes
-            except Exception as e:
-                print(f"Error sending command: {e}")
+                    ## @brief Y target adjustment for hit mode
+                    cmd_y = y_target
+                    if hit_mode_active:
+                        # Move slightly forward during hit mode for better contact
+                        cmd_y += hit_y_offset
+
+                    ## @brief Clamp to the table and scale to controller coordinates
+                    # Controller expects coordinates scaled to specific ranges
+                    scaled_x = int(max(0.0, min(x_target, TABLE_W)) * cmd_scale_x)
+                    scaled_y = int(max(0.0, min(cmd_y, TABLE_H)) * cmd_scale_y)
+
+                    ## @brief Format command for serial transmission
+                    # Command format: MXXXXYYYY where XXXX and YYYY are 4-digit coordinates
+                    # (formatted straight to bytes, no str -> ASCII encode step)
+                    msg = MOVE_CMD_FMT % (scaled_x, scaled_y)
+
+                    ## @brief Queue command for the background serial writer
+                    ser_writer.send(msg)
+                except Exception as e:
+                    print(f"Error sending command: {e}")
             
-        ## @brief Terminal output for monitoring (once per second)
-        current_time = time.time()
-        if x_target is not None and (not hasattr(main_loop, "last_print_time") or (current_time - main_loop.last_print_time) >= 1.0):
-            ## @brief Determine current operational mode
-            mode_str = "HIT" if hit_mode_active else "PREDICT"
-            status_msg = f"{mode_str}: Target={x_target:.1f},{y_target:.1f}"
+            ## @brief Terminal output for monitoring (once per second)
+            if x_target is not None and (now - last_print_time) >= 1.0:
+                ## @brief Determine current operational mode
+                mode_str = "HIT" if hit_mode_active else "PREDICT"
+                status_msg = f"{mode_str}: Target={x_target:.1f},{y_target:.1f}"
             
-            ## @brief Add timing information if available
-            if time_until_impact is not None:
-                status_msg += f" Time={time_until_impact:.2f}s"
-            else:
-                status_msg += " Time=unknown"
+                ## @brief Add timing information if available
+                if time_until_impact is not None:
+                    status_msg += f" Time={time_until_impact:.2f}s"
+                else:
+                    status_msg += " Time=unknown"
                 
-            ## @brief Add serial command information
-            if ser is not None:
-                status_msg += f" Command=M{scaled_x:04d}{scaled_y:04d}"
+                ## @brief Add serial command information
+                if ser is not None:
+                    status_msg += f" Command=M{scaled_x:04d}{scaled_y:04d}"
                 
-            print(status_msg)
-            main_loop.last_print_time = current_time
-
-        ## @brief Display FPS counter on visualization
-        cv2.putText(vis, f"FPS: {fps_display:.1f}", (30, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        
-        ## @brief Display current operational mode
-        if aggressive_mode_active:
-            if aggressive_phase == 1:
-                mode_text = "Aggressive-Position"
-                mode_color = (255, 0, 255)  # Magenta for positioning
-            elif aggressive_phase == 2:
-                mode_text = "Aggressive-Strike"
-                mode_color = (0, 0, 255)    # Red for striking
-            else:
-                mode_text = "Aggressive-Follow"
-                mode_color = (255, 165, 0)  # Orange for follow-through
-        elif hit_mode_active:
-            mode_text = "Hit"
-            mode_color = (0, 0, 255)        # Red for hit mode
-        else:
-            mode_text = "Predict"
-            mode_color = (0, 255, 0)        # Green for prediction mode
-            
-        cv2.putText(vis, mode_text, (30, 70),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, mode_color, 2)
-
-        ## @brief Display processed image in window
-        vis_display = cv2.resize(vis, (800, 600), interpolation=cv2.INTER_LINEAR)
-        cv2.imshow(win, vis_display)
-
-        ## @brief Check for quit command
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'):
-            break
-
-    ## @brief Cleanup resources
-    cap.release()
-    cv2.destroyAllWindows()
-    if ser is not None:
-        ser.close()
-        print("\nSerial port closed.\n")
+                print(status_msg)
+                last_print_time = now
+
+            ## @brief Visualization (skipped when headless)
+            if vis is not None:
+                ## @brief Display FPS counter on visualization
+                # The label itself is rasterized once per distinct text (rendered_label)
+                vis.append((draw_label, (fps_text, (30, 30), 0.8, (0, 255, 0), 2)))
+
+                ## @brief Display current operational mode
+                if aggressive_mode_active:
+                    if aggressive_phase == 1:
+                        mode_text = "Aggressive-Position"
+                        mode_color = (255, 0, 255)  # Magenta for positioning
+                    elif aggressive_phase == 2:
+                        mode_text = "Aggressive-Strike"
+                        mode_color = (0, 0, 255)    # Red for striking
+                    else:
+                        mode_text = "Aggressive-Follow"
+                        mode_color = (255, 165, 0)  # Orange for follow-through
+                elif hit_mode_active:
+                    mode_text = "Hit"
+                    mode_color = (0, 0, 255)        # Red for hit mode
+                else:
+                    mode_text = "Predict"
+                    mode_color = (0, 255, 0)        # Green for prediction mode
+
+                vis.append((draw_label, (mode_text, (30, 70), 0.8, mode_color, 2)))
+
+                ## @brief Hand the frame and its draw list to the display thread
+                display.show(frame, vis)
+
+                ## @brief Check for quit command
+                if display.quit.is_set():
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ## @brief Cleanup resources
+        cap.release()
+        if not headless:
+            display.close()
+        if ser is not None:
+            ser_writer.close()
+            ser.close()
+            print("\nSerial port closed.\n")
 
 ## @}
 
@@ -1184,6 +1803,14 @@ def main_loop():
 ## @{
 # ------------------------------------------------------------------------------
 
+## @brief SIGTERM handler: shut down like Ctrl+C
+## @details systemd stops the service with SIGTERM; raising KeyboardInterrupt
+##          lets main_loop run its cleanup instead of dying mid-command.
+## @param signum Signal number
+## @param frame Interrupted stack frame
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
 ## @brief Main program entry point with command line argument parsing
 if __name__ == "__main__":
     ## @brief Setup command line argument parser
@@ -1194,15 +1821,47 @@ if __name__ == "__main__":
         required=True,
         help="Mode = calibrate_frame | calibrate_hsv | run"
     )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        default=os.environ.get("DISPLAY") is None,
+        help="Run mode without the visualization window (default when DISPLAY is unset)"
+    )
+    parser.add_argument(
+        "--opencl",
+        action="store_true",
+        help="Run mode image processing through OpenCV's OpenCL T-API if a device is available"
+    )
+    parser.add_argument(
+        "--mask",
+        choices=["hsv", "red"],
+        default="hsv",
+        help="Run mode object mask: calibrated HSV ranges, or R - max(G, B) for red objects"
+    )
+    parser.add_argument(
+        "--decimate",
+        type=int,
+        choices=range(1, MAX_DECIMATE + 1),
+        default=1,
+        metavar="N",
+        help="Run mode: detect on every Nth camera frame only and extrapolate the "
+             "puck in between (1-%d, default 1)" % MAX_DECIMATE
+    )
     args = parser.parse_args()
 
+    ## @brief Make sure the SIMD code paths are on and size OpenCV's thread pool
+    cv2.setUseOptimized(True)
+    cv2.setNumThreads(CV_NUM_THREADS)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
     ## @brief Execute requested mode
     if args.mode == "calibrate_frame":
         calibrate_frame()
     elif args.mode == "calibrate_hsv":
         calibrate_hsv()
     elif args.mode == "run":
-        main_loop()
+        main_loop(headless=args.headless, use_opencl=args.opencl, mask_mode=args.mask,
+                  decimate=args.decimate)
     else:
         print("Unknown mode. Use --mode calibrate_frame / calibrate_hsv / run.")
 